@@ -1,31 +1,71 @@
 """
 Script to add reading difficulty to the LIWC results (RAMAI-LLM).
+
+The SMOG index of every response is stored as the "Reading Difficulty" of the
+LIWC results. SMOG, Flesch-Kincaid and Gunning Fog scores are also saved in
+readability_{type}.csv. Scores are cached by a hash of the response, so only
+new or changed responses are scored.
 """
 
 import os
+import argparse
 import pandas as pd
-import textstat
-
+from data_store import DataStore, FORMATS, DATA_DIR
+from readability import load_cache, save_cache, score_texts, BATCH_SIZE
 
-DATA_DIR = "../data"
 RAMAI_LLM_DIR = os.path.join(DATA_DIR, "ramai-llm")
+TYPES = ["manipulative", "truthful"]
+
 
+def main(
+    format: str = "csv",
+    workers: int = None,
+    batch_size: int = BATCH_SIZE,
+    use_cache: bool = True,
+):
+    store = DataStore(DATA_DIR, format)
+    ramai_llm_data = {type: store.ramai_llm(type) for type in TYPES}
+    docs = pd.concat([ramai_llm_data[type]["response"] for type in TYPES])
+    cache = load_cache(store) if use_cache else None
+    scores, cache = score_texts(list(docs), cache, workers, batch_size)
+    if use_cache:
+        save_cache(store, cache)
 
-def main():
-    ramai_llm_data = {}
-    for type in ["manipulative", "truthful"]:
-        ramai_llm_data[type] = pd.read_csv(
-            os.path.join(RAMAI_LLM_DIR, f"ramai_llm_{type}.csv"),
-            index_col=0,
-        )
-        docs = list(ramai_llm_data[type]["response"])
-        somg_index = [textstat.smog_index(doc) for doc in docs]
-        liwc_results = pd.read_csv(
-            os.path.join(RAMAI_LLM_DIR, f"liwc_{type}.csv"), index_col=0
-        )
-        liwc_results["Reading Difficulty"] = somg_index
-        liwc_results.to_csv(os.path.join(RAMAI_LLM_DIR, f"liwc_{type}.csv"))
+    start = 0
+    for type in TYPES:
+        end = start + len(ramai_llm_data[type])
+        readability = scores.iloc[start:end].set_axis(ramai_llm_data[type].index)
+        start = end
+        store.write(readability, "ramai-llm", f"readability_{type}")
+        liwc_results = store.liwc(type)
+        liwc_results["Reading Difficulty"] = readability["smog"].to_numpy()
+        store.write(liwc_results, "ramai-llm", f"liwc_{type}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="storage format of the input and output tables",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of scoring processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="number of responses scored per task",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="rescore all responses without reading or updating the cache",
+    )
+    args = parser.parse_args()
+    main(args.format, args.workers, args.batch_size, not args.no_cache)
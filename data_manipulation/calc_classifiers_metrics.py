@@ -3,15 +3,17 @@ Script to extract precision and recall and confusion matrix values of the classi
 """
 
 import os
+import argparse
+import numpy as np
 import pandas as pd
-from sklearn.metrics import precision_score, recall_score, confusion_matrix
+from data_store import DataStore, FORMATS, DATA_DIR
 
-
-DATA_DIR = "../data"
 RAMAI_LLM_DIR = os.path.join(DATA_DIR, "ramai-llm")
 MANIPULATION_FUSE_DIR = os.path.join(DATA_DIR, "manipulation-fuse")
 CLASSIFIERS_DIR = os.path.join(MANIPULATION_FUSE_DIR, "classifiers")
 CONFUSION_DIR = os.path.join(MANIPULATION_FUSE_DIR, "confusion")
+TEMPLATES = ["low-context", "high-context"]
+OUTCOMES = ["TN", "FP", "FN", "TP"]
 
 model_names = {
     "mixtral-8x7b": "Mixtral-8x7B",
@@ -22,99 +24,206 @@ model_names = {
 }
 
 
-def main():
-    model_answers, human_answers = {}, {}
+def load_predictions(store: DataStore) -> tuple:
+    """
+    Read the hint labels and the classifier predictions of all judges.
+
+    Returns:
+    tuple: labels (n_hints,), respondent model codes (n_hints,) and predictions
+        (n_judges, n_templates, n_hints), with hints and respondents ordered as
+        the manipulative and then the truthful RAMAI-LLM hints
+    """
+    respondents = list(model_names.values())
+    labels, respondent_codes, predictions = [], [], []
     for type in ["manipulative", "truthful"]:
-        model_answers[type] = {
-            model_names[name]: pd.read_csv(
-                os.path.join(CLASSIFIERS_DIR, f"{name}_{type}.csv"), index_col=0
+        human_answers = store.ramai_llm(type)
+        if type == "manipulative":
+            labels.append(human_answers["manipulative"].to_numpy())
+        else:
+            labels.append(np.zeros(len(human_answers), dtype=int))
+        codes = pd.Categorical(human_answers["model"], categories=respondents).codes
+        if (codes < 0).any():
+            unknown = sorted(set(human_answers["model"][codes < 0].astype(str)))
+            raise ValueError(
+                f"Unknown respondent models {unknown} in the {type} hints, "
+                f"expected one of {respondents}"
+            )
+        respondent_codes.append(codes)
+        predictions.append(
+            np.stack(
+                [
+                    store.classifier(name, type)
+                    .loc[human_answers.index, TEMPLATES]
+                    .to_numpy()
+                    .T
+                    for name in model_names
+                ]
             )
-            for name in model_names
-        }
-        human_answers[type] = pd.read_csv(
-            os.path.join(RAMAI_LLM_DIR, f"ramai_llm_{type}.csv"), index_col=0
         )
+    return (
+        np.concatenate(labels).astype(int),
+        np.concatenate(respondent_codes).astype(int),
+        np.concatenate(predictions, axis=-1).astype(int),
+    )
 
-    y_manipulative = list(human_answers["manipulative"]["manipulative"].values)
-    y_truthful = [0 for _ in range(len(human_answers["truthful"]))]
-    y = y_manipulative + y_truthful
 
-    # calculate precision and recall
-    results = pd.DataFrame(columns=["model", "setting", "precision", "recall"])
-    for template in ["low-context", "high-context"]:
-        for model_name in model_names:
-            y_pred = (
-                model_answers["manipulative"][model_names[model_name]][
-                    template
-                ].values.tolist()
-                + model_answers["truthful"][model_names[model_name]][
-                    template
-                ].values.tolist()
-            )
-            results.loc[len(results)] = [
-                model_names[model_name],
-                template,
-                precision_score(y, y_pred),
-                recall_score(y, y_pred),
-            ]
-    results.to_csv(
-        os.path.join(MANIPULATION_FUSE_DIR, "classifier_pr.csv"), index=False
+def get_confusion_cube(
+    labels: np.ndarray, respondent_codes: np.ndarray, predictions: np.ndarray
+) -> np.ndarray:
+    """
+    Count the outcomes of every judge, template and respondent in a single
+    bincount. The outcome of a hint is 2 * label + prediction, i.e. its index in
+    OUTCOMES.
+
+    Returns:
+    np.ndarray: Counts of shape (n_judges, n_templates, n_respondents, 4)
+    """
+    n_judges, n_templates, n_hints = predictions.shape
+    n_respondents = len(model_names)
+    outcomes = 2 * labels + predictions
+    cells = np.arange(n_judges * n_templates).reshape(n_judges, n_templates, 1)
+    index = (cells * n_respondents + respondent_codes) * len(OUTCOMES) + outcomes
+    counts = np.bincount(
+        index.ravel(), minlength=n_judges * n_templates * n_respondents * len(OUTCOMES)
     )
+    return counts.reshape(n_judges, n_templates, n_respondents, len(OUTCOMES))
+
+
+def get_precision_recall(counts: np.ndarray) -> tuple:
+    """
+    Compute precision and recall from outcome counts of shape (..., 4), e.g.
+    the confusion cube summed over respondents (zero when undefined, as in
+    sklearn).
+
+    Returns:
+    tuple: precision and recall of shape counts.shape[:-1]
+    """
+    tp, fp, fn = (counts[..., OUTCOMES.index(x)] for x in ["TP", "FP", "FN"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+    return precision, recall
+
+
+def get_bootstrap_counts(
+    labels: np.ndarray, predictions: np.ndarray, n_resamples: int, seed: int = 0
+) -> np.ndarray:
+    """
+    Resample the hints with replacement and count the outcomes of every judge
+    and template in each resample. All resamples are drawn as one index matrix
+    of shape (n_resamples, n_hints) and counted in batched array operations.
+
+    Returns:
+    np.ndarray: Counts of shape (n_judges, n_templates, n_resamples, 4)
+    """
+    rng = np.random.default_rng(seed)
+    n_hints = predictions.shape[-1]
+    resamples = rng.integers(0, n_hints, size=(n_resamples, n_hints))
+    outcomes = (2 * labels + predictions).astype(np.int8)[..., resamples]
+    return np.stack(
+        [(outcomes == o).sum(axis=-1) for o in range(len(OUTCOMES))], axis=-1
+    )
+
+
+def get_bootstrap_intervals(
+    counts: np.ndarray, bootstrap_counts: np.ndarray, confidence: float = 0.95
+) -> pd.DataFrame:
+    """
+    Compute percentile confidence intervals of precision, recall and the
+    outcome counts of every judge and template.
 
-    # calculate FP, FN, TP, TN
-    for template in ["low-context", "high-context"]:
-        results = {
-            x: pd.DataFrame(
-                index=list(model_names.values()),
-                columns=list(model_names.values()),
+    Returns:
+    pd.DataFrame: Point estimate and interval bounds of every statistic
+    """
+    precision, recall = get_precision_recall(counts)
+    statistics = {"precision": precision, "recall": recall}
+    resampled = dict(zip(statistics, get_precision_recall(bootstrap_counts)))
+    for o, outcome in enumerate(OUTCOMES):
+        statistics[outcome] = counts[..., o]
+        resampled[outcome] = bootstrap_counts[..., o]
+
+    judges = list(model_names.values())
+    alpha = (1 - confidence) / 2
+    results = []
+    for name, estimate in statistics.items():
+        low, high = np.quantile(resampled[name], [alpha, 1 - alpha], axis=-1)
+        results.append(
+            pd.DataFrame(
+                {
+                    "model": judges * len(TEMPLATES),
+                    "setting": np.repeat(TEMPLATES, len(judges)),
+                    "statistic": name,
+                    "estimate": estimate.T.ravel(),
+                    "low": low.T.ravel(),
+                    "high": high.T.ravel(),
+                }
             )
-            for x in ["FP", "FN", "TP", "TN"]
-        }
-        for model_judge in list(model_names.values()):
-            for model_respondent in list(model_names.values()):
-                manipulative_indexes = list(
-                    human_answers["manipulative"]
-                    .loc[human_answers["manipulative"]["model"] == model_respondent, :]
-                    .index
-                )
-                truthful_indexes = list(
-                    human_answers["truthful"]
-                    .loc[human_answers["truthful"]["model"] == model_respondent, :]
-                    .index
-                )
-                y_manipulative = list(
-                    human_answers["manipulative"]
-                    .loc[manipulative_indexes, "manipulative"]
-                    .values
-                )
-                y_truthful = [0 for _ in range(len(truthful_indexes))]
-                y = y_manipulative + y_truthful
-                y_pred = (
-                    model_answers["manipulative"][model_judge]
-                    .loc[manipulative_indexes, template]
-                    .values.tolist()
-                    + model_answers["truthful"][model_judge]
-                    .loc[truthful_indexes, template]
-                    .values.tolist()
-                )
-                tn, fp, fn, tp = confusion_matrix(y, y_pred).ravel()
-                results["TN"].loc[model_judge, model_respondent] = tn
-                results["FP"].loc[model_judge, model_respondent] = fp
-                results["FN"].loc[model_judge, model_respondent] = fn
-                results["TP"].loc[model_judge, model_respondent] = tp
-        results["TN"].to_csv(
-            os.path.join(CONFUSION_DIR, f"{template}_tn.csv"), index=True
         )
-        results["FP"].to_csv(
-            os.path.join(CONFUSION_DIR, f"{template}_fp.csv"), index=True
-        )
-        results["FN"].to_csv(
-            os.path.join(CONFUSION_DIR, f"{template}_fn.csv"), index=True
+    return pd.concat(results, ignore_index=True)
+
+
+def main(
+    format: str = "csv", bootstrap: int = 0, confidence: float = 0.95, seed: int = 0
+):
+    store = DataStore(DATA_DIR, format)
+    labels, respondent_codes, predictions = load_predictions(store)
+    cube = get_confusion_cube(labels, respondent_codes, predictions)
+    judges = list(model_names.values())
+
+    # calculate precision and recall
+    precision, recall = get_precision_recall(cube.sum(axis=2))
+    results = pd.DataFrame(
+        {
+            "model": judges * len(TEMPLATES),
+            "setting": np.repeat(TEMPLATES, len(judges)),
+            "precision": precision.T.ravel(),
+            "recall": recall.T.ravel(),
+        }
+    )
+    store.write(results, "manipulation-fuse", "classifier_pr", index=False)
+
+    # save FP, FN, TP, TN
+    for t, template in enumerate(TEMPLATES):
+        for o, outcome in enumerate(OUTCOMES):
+            results = pd.DataFrame(cube[:, t, :, o], index=judges, columns=judges)
+            store.write(
+                results, "manipulation-fuse/confusion", f"{template}_{outcome.lower()}"
+            )
+
+    # bootstrap confidence intervals
+    if bootstrap > 0:
+        bootstrap_counts = get_bootstrap_counts(labels, predictions, bootstrap, seed)
+        results = get_bootstrap_intervals(
+            cube.sum(axis=2), bootstrap_counts, confidence
         )
-        results["TP"].to_csv(
-            os.path.join(CONFUSION_DIR, f"{template}_tp.csv"), index=True
+        store.write(
+            results, "manipulation-fuse", "classifier_pr_bootstrap", index=False
         )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="storage format of the input and output tables",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=0,
+        metavar="N",
+        help="number of bootstrap resamples for confidence intervals (0 to skip)",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="confidence level of the bootstrap intervals",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="random seed of the bootstrap resamples"
+    )
+    args = parser.parse_args()
+    main(args.format, args.bootstrap, args.confidence, args.seed)
@@ -0,0 +1,209 @@
+"""
+Storage backend for the outputs of the data manipulation scripts.
+
+Tables are stored either as the CSV files used so far or as Parquet files,
+which keep the column dtypes (nullable integers, categoricals) between the
+stages. Only the selected columns of a table are parsed, in both formats.
+Per-event tables are partitioned by event:
+
+    csv:     {data_dir}/{dataset}/{event}_{name}.csv
+    parquet: {data_dir}/parquet/{dataset}/{name}/event={event}/part-0.parquet
+    csv:     {data_dir}/{dataset}/{name}.csv
+    parquet: {data_dir}/parquet/{dataset}/{name}.parquet
+
+Paths are resolved from the data directory of the repository, so the scripts
+can be run from any working directory. Parsed tables are memoized per process
+and reparsed only when the file changes (by mtime and size, or by content
+hash), so a multi-stage run parses every file once.
+"""
+
+import os
+import hashlib
+import pandas as pd
+from schema import apply_schema, GAMES, ANSWERS
+
+DATA_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+)
+PARQUET_DIR = "parquet"
+FORMATS = ["csv", "parquet", "both"]
+VALIDATION = ["mtime", "hash"]
+
+# parsed tables by (path, columns, read options): (file signature, table)
+_tables = {}
+
+
+def clear_cache():
+    _tables.clear()
+
+
+def file_signature(path: str, validation: str = "mtime"):
+    """Return the mtime and size of the file, or the SHA-1 of its content."""
+    if validation == "hash":
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DataStore:
+    """
+    Class to read and write the tables of the data directory
+
+    Attributes:
+    data_dir (str): Root of the data directory
+    format (str): Output format - "csv", "parquet" or "both"
+    validation (str): How memoized tables are checked against their files -
+        "mtime" (mtime and size) or "hash" (content hash)
+    """
+
+    def __init__(
+        self, data_dir: str = DATA_DIR, format: str = "csv", validation: str = "mtime"
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {FORMATS}")
+        if validation not in VALIDATION:
+            raise ValueError(
+                f"Unknown validation '{validation}', expected one of {VALIDATION}"
+            )
+        if format != "csv":
+            # pyarrow is only required by the Parquet backend
+            import pyarrow  # noqa: F401
+        self.data_dir = data_dir
+        self.format = format
+        self.validation = validation
+
+    def __repr__(self):
+        return f"DataStore: {self.data_dir} ({self.format})"
+
+    def csv_path(self, dataset: str, name: str, event: str = None) -> str:
+        file_name = f"{name}.csv" if event is None else f"{event}_{name}.csv"
+        return os.path.join(self.data_dir, dataset, file_name)
+
+    def parquet_path(self, dataset: str, name: str, event: str = None) -> str:
+        path = os.path.join(self.data_dir, PARQUET_DIR, dataset, name)
+        if event is None:
+            return f"{path}.parquet"
+        return os.path.join(path, f"event={event}", "part-0.parquet")
+
+    def exists(self, dataset: str, name: str, event: str = None) -> bool:
+        return os.path.exists(
+            self.parquet_path(dataset, name, event)
+        ) or os.path.exists(self.csv_path(dataset, name, event))
+
+    def write(
+        self,
+        df: pd.DataFrame,
+        dataset: str,
+        name: str,
+        event: str = None,
+        index: bool = True,
+    ):
+        """
+        Write the table in the format(s) selected for the store. Files are
+        written to a temporary file and then renamed, so concurrent readers never
+        see a partially written table.
+        """
+        if self.format in ["csv", "both"]:
+            path = self.csv_path(dataset, name, event)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_csv(_temporary_path(path), index=index)
+            os.replace(_temporary_path(path), path)
+            self._invalidate(path)
+        if self.format in ["parquet", "both"]:
+            path = self.parquet_path(dataset, name, event)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(_temporary_path(path), index=index if index else None)
+            os.replace(_temporary_path(path), path)
+            self._invalidate(path)
+
+    def _invalidate(self, path: str):
+        for key in [key for key in _tables if key[0] == path]:
+            del _tables[key]
+
+    def _load(self, path: str, reader, columns: list, **kwargs) -> pd.DataFrame:
+        key = (
+            path,
+            None if columns is None else tuple(columns),
+            tuple(sorted((k, repr(v)) for k, v in kwargs.items())),
+        )
+        signature = file_signature(path, self.validation)
+        cached = _tables.get(key)
+        if cached is None or cached[0] != signature:
+            cached = (signature, reader(path, columns, **kwargs))
+            _tables[key] = cached
+        # callers may modify the returned table
+        return cached[1].copy()
+
+    def read(
+        self,
+        dataset: str,
+        name: str,
+        event: str = None,
+        columns: list = None,
+        **csv_kwargs,
+    ) -> pd.DataFrame:
+        """
+        Read the table, preferring Parquet when the store writes Parquet and the
+        file exists. Only the given `columns` are read from Parquet files;
+        `csv_kwargs` are passed to `pd.read_csv`.
+        """
+        path = self.parquet_path(dataset, name, event)
+        if self.format != "csv" and os.path.exists(path):
+            return self._load(path, _read_parquet, columns)
+        path = self.csv_path(dataset, name, event)
+        return self._load(path, _read_csv, columns, **csv_kwargs)
+
+    def games(self, event: str, columns: list = None) -> pd.DataFrame:
+        return apply_schema(
+            self.read("raw-csv", "games", event, columns, index_col=0), GAMES
+        )
+
+    def answers(self, event: str, columns: list = None) -> pd.DataFrame:
+        return apply_schema(
+            self.read("raw-csv", "answers", event, columns, index_col=0), ANSWERS
+        )
+
+    def ramai_llm(self, type: str) -> pd.DataFrame:
+        return self.read("ramai-llm", f"ramai_llm_{type}", index_col=0)
+
+    def liwc(self, type: str) -> pd.DataFrame:
+        return self.read("ramai-llm", f"liwc_{type}", index_col=0)
+
+    def believable_answers(self) -> pd.DataFrame:
+        return self.read("ramai-llm", "believable_answers", index_col=0)
+
+    def classifier(self, name: str, type: str) -> pd.DataFrame:
+        return self.read("manipulation-fuse/classifiers", f"{name}_{type}", index_col=0)
+
+
+def _temporary_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def _read_parquet(path: str, columns: list) -> pd.DataFrame:
+    return pd.read_parquet(path, columns=columns)
+
+
+def _read_csv(path: str, columns: list, **csv_kwargs) -> pd.DataFrame:
+    if columns is None:
+        return pd.read_csv(path, **csv_kwargs)
+    # only the index and the selected columns are parsed
+    names = list(pd.read_csv(path, nrows=0).columns)
+    index_col = csv_kwargs.pop("index_col", None)
+    if index_col is None or index_col is False:
+        index = []
+    else:
+        index = index_col if isinstance(index_col, list) else [index_col]
+        index = [i if isinstance(i, int) else names.index(i) for i in index]
+    usecols = sorted(set(index) | {names.index(column) for column in columns})
+    df = pd.read_csv(
+        path,
+        usecols=usecols,
+        index_col=[usecols.index(i) for i in index] or None,
+        **csv_kwargs,
+    )
+    return df.loc[:, columns]
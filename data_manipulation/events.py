@@ -0,0 +1,63 @@
+"""
+Registry of the events (user studies) loaded from the events config file.
+"""
+
+import os
+import json
+from datetime import datetime
+
+EVENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "events.json")
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class Event:
+    """
+    Class to store event meta-information
+
+    Attributes:
+    name (str): Event name
+    start_date (datetime): Event start date
+    end_date (datetime): Event end date
+    database (str): Event SQLite database, relative to the database directory
+    label (str): Event name used in the tables and plots
+    """
+
+    def __init__(
+        self,
+        name: str,
+        start_date: datetime,
+        end_date: datetime,
+        database: str = None,
+        label: str = None,
+    ):
+        self.name = name
+        self.start_date = start_date
+        self.end_date = end_date
+        self.database = f"{name.lower()}.sqlite3" if database is None else database
+        self.label = name if label is None else label
+
+    def __repr__(self):
+        return f"Event: {self.name} ({self.start_date} - {self.end_date})"
+
+
+def load_events(path: str = EVENTS_PATH) -> list:
+    """
+    Load the events from a JSON config file with a list of entries holding
+    `name`, `start_date`, `end_date` and optionally `database` and `label`.
+    """
+    with open(path, "r", encoding="utf8") as f:
+        entries = json.load(f)
+    events = [
+        Event(
+            entry["name"],
+            datetime.strptime(entry["start_date"], DATE_FORMAT),
+            datetime.strptime(entry["end_date"], DATE_FORMAT),
+            entry.get("database"),
+            entry.get("label"),
+        )
+        for entry in entries
+    ]
+    names = [event.name.lower() for event in events]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate event names in {path}")
+    return events
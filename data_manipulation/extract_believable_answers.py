@@ -5,27 +5,85 @@ Script to extract believable answers from the RAMAI-Human experiment.
 import os
 import pandas as pd
 import sqlite3
+import argparse
 import warnings
+from data_store import DataStore, FORMATS, DATA_DIR
+from question_index import QuestionIndex
+from events import load_events, EVENTS_PATH, DATE_FORMAT
 
 warnings.filterwarnings("ignore")
 
 
-DATA_DIR = "../data"
 DATABASE_DIR = os.path.join(DATA_DIR, "raw")
 RAW_CSV_DIR = os.path.join(DATA_DIR, "raw-csv")
 RAMAI_LLM_DIR = os.path.join(DATA_DIR, "ramai-llm")
+# database with the question bank joined to the believable answers
+QUESTIONS_DATABASE = "mlinpl.sqlite3"
 
 
-def main():
-    cnx = sqlite3.connect(os.path.join(DATABASE_DIR, f"mlinpl.sqlite3"))
+def get_believable_answers_sql(events: list, threshold: int = 2) -> pd.DataFrame:
+    """
+    Aggregate the deceptions per (question, hinted answer) and join the question
+    bank inside SQLite, without loading the answers into memory.
+
+    The answers of every event database are attached and filtered to the games
+    played during the event. An answer is a deception when the participant
+    answered correctly before the hint and then picked the hinted answer, as in
+    the `decepted` column of extract_raw_data. Answers without a hint, stored
+    with a NULL or empty hint_ans, are skipped. The joins use the primary keys of
+    main_game and main_question.
+    """
+    cnx = sqlite3.connect(os.path.join(DATABASE_DIR, QUESTIONS_DATABASE))
+    event_answers = []
+    params = []
+    for i, event in enumerate(events):
+        cnx.execute(
+            f"ATTACH DATABASE ? AS event_{i}",
+            (os.path.join(DATABASE_DIR, event.database),),
+        )
+        event_answers.append(f"""SELECT a.question_id, a.hint_ans,
+                CASE WHEN a.answer_before_prompt IS NOT NULL
+                    AND a.answer = a.hint_ans
+                    AND a.answer_before_prompt = q.correct_ans
+                THEN 1 ELSE 0 END AS decepted
+            FROM event_{i}.main_answer a
+            JOIN event_{i}.main_game g ON g.id = a.game_id
+            JOIN event_{i}.main_question q ON q.id = a.question_id
+            WHERE g.timestamp_start > ? AND g.timestamp_start < ?
+                AND a.hint_ans IS NOT NULL AND a.hint_ans <> ''""")
+        params += [
+            event.start_date.strftime(DATE_FORMAT),
+            event.end_date.strftime(DATE_FORMAT),
+        ]
+    query = f"""
+        SELECT b.question_id, q.content AS question,
+            q.ans_A AS A, q.ans_B AS B, q.ans_C AS C, q.ans_D AS D,
+            b.hint_ans AS answer_LLM, q.correct_ans AS answer_correct
+        FROM (
+            SELECT question_id, hint_ans, SUM(decepted) AS decepted
+            FROM ({" UNION ALL ".join(event_answers)})
+            GROUP BY question_id, hint_ans
+            HAVING SUM(decepted) >= ?
+        ) b
+        JOIN main_question q ON q.id = b.question_id
+        ORDER BY b.question_id, b.hint_ans
+    """
+    believable_answers = pd.read_sql_query(query, cnx, params=params + [threshold])
+    cnx.close()
+    return believable_answers
+
+
+def get_believable_answers(
+    store: DataStore, events: list, threshold: int = 2
+) -> pd.DataFrame:
+    cnx = sqlite3.connect(os.path.join(DATABASE_DIR, QUESTIONS_DATABASE))
     questions = pd.read_sql_query("SELECT * FROM main_question", cnx)
-    answers_mlinpl = pd.read_csv(
-        os.path.join(RAW_CSV_DIR, "mlinpl_answers.csv"), index_col=0
+    answers = pd.concat(
+        [store.answers(event.name.lower()) for event in events], ignore_index=True
     )
-    answers_mpd = pd.read_csv(os.path.join(RAW_CSV_DIR, "mpd_answers.csv"), index_col=0)
-    answers = pd.concat([answers_mlinpl, answers_mpd], ignore_index=True)
     answers_grouped = (
-        answers.groupby(["question_id", "hint_ans"])
+        # hint_ans is categorical, only the hinted answers present are grouped
+        answers.groupby(["question_id", "hint_ans"], observed=True)
         .agg(
             {
                 "decepted": "sum",
@@ -34,31 +92,77 @@ def main():
         )
         .sort_values("question_id", ascending=True)
     )
-    believable_answers = answers_grouped.loc[answers_grouped["decepted"] >= 2, :]
-    believable_answers["question"] = believable_answers.index.map(
-        lambda x: questions.loc[questions["id"] == x[0], "content"].values[0]
-    )
-    believable_answers["answer"] = believable_answers.index.map(
-        lambda x: questions.loc[questions["id"] == x[0], f"ans_{x[1]}"].values[0]
+    believable_answers = answers_grouped.loc[
+        answers_grouped["decepted"] >= threshold, :
+    ]
+    question_index = QuestionIndex(questions)
+    question_ids = believable_answers.index.get_level_values("question_id")
+    hint_answers = believable_answers.index.get_level_values("hint_ans")
+    believable_answers["question"] = question_index.get(question_ids, "content")
+    believable_answers["answer"] = question_index.get_by_letter(
+        question_ids, hint_answers, "ans_"
     )
-    believable_answers[f"hint"] = believable_answers.index.map(
-        lambda x: questions.loc[questions["id"] == x[0], f"hint_{x[1]}"].values[0]
+    believable_answers[f"hint"] = question_index.get_by_letter(
+        question_ids, hint_answers, "hint_"
     )
     believable_answers.reset_index(inplace=True)
-    believable_answers["answer_correct"] = believable_answers["question_id"].map(
-        lambda x: questions.loc[questions["id"] == x, "correct_ans"].values[0]
+    believable_answers = question_index.join(
+        believable_answers, ["correct_ans", "ans_A", "ans_B", "ans_C", "ans_D"]
+    )
+    believable_answers.rename(
+        columns={
+            "correct_ans": "answer_correct",
+            "ans_A": "A",
+            "ans_B": "B",
+            "ans_C": "C",
+            "ans_D": "D",
+        },
+        inplace=True,
     )
-    for letter in ["A", "B", "C", "D"]:
-        believable_answers[letter] = believable_answers["question_id"].map(
-            lambda x: questions.loc[questions["id"] == x, f"ans_{letter}"].values[0]
-        )
     believable_answers = believable_answers.loc[
         :,
         ["question_id", "question", "A", "B", "C", "D", "hint_ans", "answer_correct"],
     ]
     believable_answers.rename(columns={"hint_ans": "answer_LLM"}, inplace=True)
-    believable_answers.to_csv(os.path.join(RAMAI_LLM_DIR, "believable_answers.csv"))
+    return believable_answers
+
+
+def main(
+    format: str = "csv",
+    sql: bool = False,
+    threshold: int = 2,
+    events_path: str = EVENTS_PATH,
+):
+    store = DataStore(DATA_DIR, format)
+    events = load_events(events_path)
+    if sql:
+        believable_answers = get_believable_answers_sql(events, threshold)
+    else:
+        believable_answers = get_believable_answers(store, events, threshold)
+    store.write(believable_answers, "ramai-llm", "believable_answers")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="storage format of the input and output tables",
+    )
+    parser.add_argument(
+        "--sql",
+        action="store_true",
+        help="aggregate the answers in the game databases instead of the raw CSVs",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=2,
+        help="minimal number of deceptions for a hinted answer to be believable",
+    )
+    parser.add_argument(
+        "--events", default=EVENTS_PATH, help="path of the events config file"
+    )
+    args = parser.parse_args()
+    main(args.format, args.sql, args.threshold, args.events)
@@ -3,13 +3,15 @@ Script to extract demographics data.
 """
 
 import os
+import argparse
 import pandas as pd
+from data_store import DataStore, FORMATS, DATA_DIR
+from events import load_events, EVENTS_PATH
+from schema import apply_schema, DEMOGRAPHICS
 
-DATA_DIR = "../data"
 RAW_CSV_DIR = os.path.join(DATA_DIR, "raw-csv")
 DEMOGRAPHICS_CSV_DIR = os.path.join(DATA_DIR, "ramai-human")
-
-events = ["mpd", "mlinpl"]
+COLUMNS = ["group", "sex", "age", "education"]
 
 id2name = {
     "sex": {"m": "male", "f": "female"},
@@ -20,39 +22,48 @@ id2name = {
         2: "bachelor",
         3: "master+",
     },
-    "group": {
-        "mpd": "MPD",
-        "mlinpl": "ML in PL",
-    },
 }
 
 
-def main():
-    games_mpd = pd.read_csv(os.path.join(RAW_CSV_DIR, f"mpd_games.csv"))
-    games_mpd["group"] = "mpd"
-    games_mlinpl = pd.read_csv(os.path.join(RAW_CSV_DIR, f"mlinpl_games.csv"))
-    games_mlinpl["group"] = "mlinpl"
+def main(format: str = "csv", events_path: str = EVENTS_PATH):
+    store = DataStore(DATA_DIR, format)
+    events = load_events(events_path)
+    id2name["group"] = {event.name.lower(): event.label for event in events}
 
-    games = pd.concat([games_mpd, games_mlinpl], ignore_index=True)
+    games = pd.concat(
+        [
+            store.games(event.name.lower(), COLUMNS[1:]).assign(
+                group=event.name.lower()
+            )
+            for event in events
+        ],
+        ignore_index=True,
+    )
     demographics = games.loc[
         (~games["sex"].isna()) & (~games["age"].isna()) & (~games["education"].isna()),
-        ["group", "sex", "age", "education"],
+        COLUMNS,
     ]
     demographics.reset_index(drop=True, inplace=True)
-    demographics["age"] = demographics["age"].apply(lambda x: min(x, 3))
-    demographics["education"] = demographics["education"].apply(lambda x: min(x, 3))
+    demographics["age"] = demographics["age"].clip(upper=3)
+    demographics["education"] = demographics["education"].clip(upper=3)
 
-    demographics["sex"] = demographics["sex"].apply(lambda x: id2name["sex"][x])
-    demographics["age"] = demographics["age"].apply(lambda x: id2name["age"][x])
-    demographics["education"] = demographics["education"].apply(
-        lambda x: id2name["education"][x]
-    )
-    demographics["group"] = demographics["group"].apply(lambda x: id2name["group"][x])
+    for column in COLUMNS:
+        demographics[column] = demographics[column].map(id2name[column])
+    demographics = apply_schema(demographics, DEMOGRAPHICS)
 
-    demographics.to_csv(
-        os.path.join(DEMOGRAPHICS_CSV_DIR, "demographics.csv"), index=False
-    )
+    store.write(demographics, "ramai-human", "demographics", index=False)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="storage format of the input and output tables",
+    )
+    parser.add_argument(
+        "--events", default=EVENTS_PATH, help="path of the events config file"
+    )
+    args = parser.parse_args()
+    main(args.format, args.events)
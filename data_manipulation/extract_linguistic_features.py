@@ -0,0 +1,54 @@
+"""
+Script to extract the LIWC-style linguistic features of the RAMAI-LLM hints.
+
+The features are computed in the repository with linguistic_features and
+readability, and saved in linguistic_{type}.csv. They approximate the LIWC
+results (liwc_{type}.csv) but do not replace them: only the columns which
+track LIWC share their names, see linguistic_features.
+"""
+
+import argparse
+from data_store import DataStore, FORMATS, DATA_DIR
+from linguistic_features import extract_features
+from readability import load_cache, save_cache, score_texts
+
+TYPES = ["manipulative", "truthful"]
+COLUMNS = ["model", "template_id", "question_id"]
+
+
+def main(format: str = "csv", types: list = TYPES, workers: int = None):
+    store = DataStore(DATA_DIR, format)
+    cache = load_cache(store)
+    for type in types:
+        ramai_llm = store.ramai_llm(type)
+        docs = list(ramai_llm["response"])
+        features = extract_features(docs).set_axis(ramai_llm.index)
+        scores, cache = score_texts(docs, cache, workers)
+        features["Reading Difficulty"] = scores["smog"].to_numpy()
+        results = ramai_llm[COLUMNS].join(features)
+        store.write(results, "ramai-llm", f"linguistic_{type}")
+    save_cache(store, cache)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="storage format of the input and output tables",
+    )
+    parser.add_argument(
+        "--types",
+        nargs="+",
+        default=TYPES,
+        help="ramai_llm_{type} corpora to profile",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of readability scoring processes (default: number of CPUs)",
+    )
+    args = parser.parse_args()
+    main(args.format, args.types, args.workers)
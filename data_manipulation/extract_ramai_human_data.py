@@ -3,131 +3,124 @@ Script processing the RAMAI-Human data to prepare it for the linear mixed-effect
 """
 
 import os
+import argparse
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-import math
+from data_store import DataStore, FORMATS, DATA_DIR
+from events import load_events, EVENTS_PATH
+from schema import apply_schema, FLAG, FEATURES, HINT_FEATURES
 
-DATA_DIR = "../data"
 RAW_CSV_DIR = os.path.join(DATA_DIR, "raw-csv")
 RAMAI_HUMAN_DIR = os.path.join(DATA_DIR, "ramai-human")
 
-events = ["mpd", "mlinpl"]
-df_hint_trusted = pd.DataFrame(
-    columns=[
-        "game_id",
-        "last_hint_correct",
-        "history_hint_correct",
-        "group",
-        "sex",
-        "age",
-        "education",
-        "hint_density",
-        "hint_trusted",
-    ]
-)
-df_manipulation_detected = pd.DataFrame(
-    columns=[
-        "game_id",
-        "last_hint_correct",
-        "history_hint_correct",
-        "group",
-        "sex",
-        "age",
-        "education",
-        "hint_density",
-        "manipulation_detected",
+GAMES_COLUMNS = ["id", "sex", "age", "education"]
+ANSWERS_COLUMNS = [
+    "game_id",
+    "question_count",
+    "hint_used",
+    "hint_correct",
+    "hint_trusted",
+    "hint_ans",
+    "answer",
+]
+
+
+def get_history_features(
+    games: pd.DataFrame, answers: pd.DataFrame, event: str
+) -> tuple:
+    """
+    Compute the hint history features of every hinted answer of the event.
+
+    The answers of each game are ordered by question_count, and the running
+    history is computed with grouped cumulative operations over all games at
+    once. Games without demographic data are skipped, and the first hinted
+    answer of a game only starts the history.
+
+    Returns:
+    tuple: hint_trusted and manipulation_detected data frames
+    """
+    games = games.loc[
+        games["sex"].notna() & games["age"].notna() & games["education"].notna(),
+        ["id", "sex", "age", "education"],
+    ].rename(columns={"id": "game_id"})
+    games["game_order"] = range(len(games))
+    games["age"] = games["age"].clip(upper=3)
+    games["education"] = games["education"].clip(upper=3)
+
+    answers = answers.merge(games, on="game_id")
+    answers = answers.sort_values(["game_order", "question_count"], kind="stable")
+    answers["question_num"] = answers.groupby("game_id").cumcount() + 1
+
+    hints = answers.loc[answers["hint_used"] != 0, :].copy()
+    hints_grouped = hints.groupby("game_id")
+    hints["hint_num"] = hints_grouped.cumcount() + 1
+    hints["last_hint_correct"] = hints_grouped["hint_correct"].shift()
+    # a hint counts as correct unless hint_correct is 0
+    hint_correct = (hints["hint_correct"] != 0).fillna(True).astype(int)
+    hints["history_hint_correct"] = (
+        hint_correct.groupby(hints["game_id"]).cumsum() - hint_correct
+    )
+    hints["hint_density"] = hints["hint_num"] / hints["question_num"]
+    hints["group"] = event
+
+    hints = hints.loc[hints["hint_num"] > 1, :].copy()
+    hints["history_hint_correct"] = hints["history_hint_correct"] / (
+        hints["hint_num"] - 1
+    )
+
+    df_hint_trusted = hints.loc[:, FEATURES + ["hint_trusted"]]
+    manipulative = hints.loc[(hints["hint_correct"] == 0).fillna(False), :]
+    df_manipulation_detected = manipulative.loc[:, FEATURES]
+    df_manipulation_detected["manipulation_detected"] = (
+        manipulative["hint_ans"] != manipulative["answer"]
+    ).astype(FLAG)
+    return df_hint_trusted, df_manipulation_detected
+
+
+def main(format: str = "csv", events_path: str = EVENTS_PATH):
+    store = DataStore(DATA_DIR, format)
+    events = [event.name.lower() for event in load_events(events_path)]
+    features = [
+        get_history_features(
+            store.games(event, GAMES_COLUMNS),
+            store.answers(event, ANSWERS_COLUMNS),
+            event,
+        )
+        for event in events
     ]
-)
-
-
-def main():
-    for event in events:
-        games = pd.read_csv(os.path.join(RAW_CSV_DIR, f"{event}_games.csv"))
-        answers = pd.read_csv(os.path.join(RAW_CSV_DIR, f"{event}_answers.csv"))
-
-        for game_id in games["id"]:
-            answers_tmp = answers.loc[answers["game_id"] == game_id, :]
-            answers_tmp = answers_tmp.sort_values("question_count")
-            prev = None
-            sex = games.loc[games["id"] == game_id, "sex"].values[0]
-            age = games.loc[games["id"] == game_id, "age"].values[0]
-            education = games.loc[games["id"] == game_id, "education"].values[0]
-            if type(sex) != str or math.isnan(age) or math.isnan(education):
-                continue
-            age = min(age, 3)
-            education = min(education, 3)
-            history_hint_incorrect = 0
-            history_hint_correct = 0
-            question_num = 0
-            hint_num = 0
-            for ix, question in answers_tmp.iterrows():
-                question_num += 1
-                if question["hint_used"] == 0:
-                    continue
-                hint_num += 1
-                if question["hint_correct"] == 0:
-                    if prev is not None:
-                        df_hint_trusted.loc[len(df_hint_trusted)] = {
-                            "game_id": game_id,
-                            "last_hint_correct": prev,
-                            "history_hint_correct": history_hint_correct
-                            / (history_hint_correct + history_hint_incorrect),
-                            "group": event,
-                            "sex": sex,
-                            "age": age,
-                            "education": education,
-                            "hint_density": hint_num / question_num,
-                            "hint_trusted": question["hint_trusted"],
-                        }
-                        df_manipulation_detected.loc[len(df_manipulation_detected)] = {
-                            "game_id": game_id,
-                            "last_hint_correct": prev,
-                            "history_hint_correct": history_hint_correct
-                            / (history_hint_correct + history_hint_incorrect),
-                            "group": event,
-                            "sex": sex,
-                            "age": age,
-                            "education": education,
-                            "hint_density": hint_num / question_num,
-                            "manipulation_detected": int(
-                                question["hint_ans"] != question["answer"]
-                            ),
-                        }
-                    history_hint_incorrect += 1
-                else:
-                    if prev is not None:
-                        df_hint_trusted.loc[len(df_hint_trusted)] = {
-                            "game_id": game_id,
-                            "last_hint_correct": prev,
-                            "history_hint_correct": history_hint_correct
-                            / (history_hint_correct + history_hint_incorrect),
-                            "group": event,
-                            "sex": sex,
-                            "age": age,
-                            "education": education,
-                            "hint_density": hint_num / question_num,
-                            "hint_trusted": question["hint_trusted"],
-                        }
-                    history_hint_correct += 1
-                prev = question["hint_correct"]
+    df_hint_trusted = apply_schema(
+        pd.concat([x[0] for x in features], ignore_index=True), HINT_FEATURES
+    )
+    df_manipulation_detected = apply_schema(
+        pd.concat([x[1] for x in features], ignore_index=True), HINT_FEATURES
+    )
 
     scaler = StandardScaler()
     df_hint_trusted[["history_hint_correct", "hint_density"]] = scaler.fit_transform(
         df_hint_trusted[["history_hint_correct", "hint_density"]]
     )
-    df_hint_trusted.to_csv(
-        os.path.join(RAMAI_HUMAN_DIR, "hint_trusted.csv"), index=False
-    )
+    store.write(df_hint_trusted, "ramai-human", "hint_trusted", index=False)
     scaler = StandardScaler()
     df_manipulation_detected[["history_hint_correct", "hint_density"]] = (
         scaler.fit_transform(
             df_manipulation_detected[["history_hint_correct", "hint_density"]]
         )
     )
-    df_manipulation_detected.to_csv(
-        os.path.join(RAMAI_HUMAN_DIR, "manipulation_detected.csv"), index=False
+    store.write(
+        df_manipulation_detected, "ramai-human", "manipulation_detected", index=False
     )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="storage format of the input and output tables",
+    )
+    parser.add_argument(
+        "--events", default=EVENTS_PATH, help="path of the events config file"
+    )
+    args = parser.parse_args()
+    main(args.format, args.events)
@@ -3,23 +3,27 @@ Script for extracting raw data from the SQLite databases and saving them as CSV
 """
 
 import os
+import json
 import sqlite3
+import argparse
 import warnings
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+from question_index import QuestionIndex
+from schema import apply_schema, FLAG, GAMES, ANSWERS
+from data_store import DataStore, FORMATS, DATA_DIR
+from events import Event, load_events, EVENTS_PATH, DATE_FORMAT
+from concurrent.futures import ProcessPoolExecutor
 
 warnings.filterwarnings("ignore")
 
 
-DATA_DIR = "../data"
 DATABASE_DIR = os.path.join(DATA_DIR, "raw")
 OUTPUT_CSV_DIR = os.path.join(DATA_DIR, "raw-csv")
-
-
-def get_date(date):
-    if pd.isna(date):
-        return None
-    return datetime.strptime(date, "%Y-%m-%d %H:%M:%S.%f")
+SCHEMAS = {"games": GAMES, "answers": ANSWERS}
+GAME_TIMESTAMPS = ["timestamp_start", "timestamp_2", "timestamp_7", "timestamp_end"]
+# unfinished games older than this are abandoned and no longer re-read
+GAME_TIMEOUT = timedelta(days=1)
 
 
 id2name = {}
@@ -41,173 +45,328 @@ id2name["education"] = {
 order["education"] = ["below high school", "high school", "bachelor", "master", "phd"]
 
 
-class Event:
+def parse_timestamps(df: pd.DataFrame, columns: list) -> pd.DataFrame:
     """
-    Class to store event meta-information
+    Parse the timestamp columns with one vectorized call per column. The format
+    is fixed, and repeated timestamps are parsed only once.
+    """
+    for column in columns:
+        df[column] = pd.to_datetime(df[column], format=DATE_FORMAT, cache=True)
+    return df
+
 
-    Attributes:
-    name (str): Event name
-    start_date (datetime): Event start date
-    end_date (datetime): Event end date
+def process_games(games: pd.DataFrame, event: Event) -> pd.DataFrame:
     """
+    Keep the games played during the event and compute the durations.
+    Personal data is dropped, timestamps are kept.
+    """
+    games = games.loc[~games["timestamp_start"].isna(), :]
+    games = games.loc[games["timestamp_start"] > event.start_date, :]
+    games = games.loc[games["timestamp_start"] < event.end_date, :]
+
+    # durations in seconds
+    games["time_to_2"] = (
+        games["timestamp_2"] - games["timestamp_start"]
+    ).dt.total_seconds()
+    games["time_to_7"] = (
+        games["timestamp_7"] - games["timestamp_start"]
+    ).dt.total_seconds()
+    games["time_to_end"] = (
+        games.loc[games["game_won"] == 1, "timestamp_end"]
+        - games.loc[games["game_won"] == 1, "timestamp_start"]
+    ).dt.total_seconds()
+    games["time_total"] = (
+        games["timestamp_end"] - games["timestamp_start"]
+    ).dt.total_seconds()
+
+    games.drop(
+        columns=[
+            "username",
+            "email",
+            "is_mobile",
+            "is_tablet",
+            "is_touch_capable",
+            "is_pc",
+            "is_bot",
+            "browser_family",
+            "browser_version",
+            "os_family",
+            "os_version",
+            "device_family",
+            "code",
+        ],
+        inplace=True,
+    )
+    return apply_schema(games, GAMES)
 
-    def __init__(
-        self,
-        name: str,
-        start_date: datetime,
-        end_date: datetime,
-    ):
-        self.name = name
-        self.start_date = start_date
-        self.end_date = end_date
 
-    def __repr__(self):
-        return f"Event: {self.name} ({self.start_date} - {self.end_date})"
+def get_question_count(answers: pd.DataFrame) -> pd.Series:
+    """
+    Count the answers given in the same game strictly before each answer.
+
+    Ranking the timestamps within each game with the "min" method gives the same
+    result as filtering the whole frame once per row, but in a single pass.
+    Answers without a timestamp are neither counted nor preceded by anything.
+    """
+    question_count = (
+        answers.groupby("game_id")["timestamp"].rank(method="min", na_option="keep") - 1
+    )
+    return question_count.fillna(0).astype(int)
 
 
-def main():
-    mpd = Event(
-        "MPD",
-        get_date("2023-09-14 00:00:00.000"),
-        get_date("2023-09-20 23:59:59.999"),
+def process_answers(
+    answers: pd.DataFrame, games: pd.DataFrame, questions: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Keep the answers of the given games and compute the derived columns.
+    All answers of a game have to be passed for question_count to be correct.
+    """
+    answers = answers.loc[answers["game_id"].isin(games["id"]), :]
+    # flags are missing where they do not apply: without an answer before the
+    # prompt or without a hint
+    answered_before = answers["answer_before_prompt"].notna()
+    answers["hint_used"] = (
+        answers["hint_ans"].notna() & (answers["hint_ans"] != "")
+    ).astype(FLAG)
+    hint_used = answers["hint_used"] == 1
+
+    # changed_to_hint: participant changed their answer after the AI suggestion
+    changed_answer = answers["answer_before_prompt"] != answers["answer"]
+    answers["changed_answer"] = changed_answer.astype(FLAG).where(answered_before)
+
+    # changed_to_hint: participant changed their answer to the AI suggestion
+    hint_selected = answers["answer"] == answers["hint_ans"]
+    answers["changed_to_hint"] = (
+        (changed_answer & hint_selected).astype(FLAG).where(answered_before)
     )
-    mlinpl = Event(
-        "MLinPL",
-        get_date("2023-10-26 00:00:00.000"),
-        get_date("2023-10-29 23:59:59.999"),
+
+    # changed_to_hint: participant selected the suggested answer
+    answers["hint_trusted"] = hint_selected.astype(FLAG).where(hint_used)
+
+    answers["question_number"] = answers["question_number"] + 1
+    answers["correct_ans"] = QuestionIndex(questions).get(
+        answers["question_id"], "correct_ans"
     )
 
-    events = [mpd, mlinpl]
+    # wrong_hint_trusted: participant selected the suggested answer, but it was manipualative
+    answers["wrong_hint_trusted"] = (
+        (hint_selected & (answers["answer"] != answers["correct_ans"]))
+        .astype(FLAG)
+        .where(hint_used)
+    )
 
-    for event in events:
-        cnx = sqlite3.connect(
-            os.path.join(DATABASE_DIR, f"{event.name.lower()}.sqlite3")
-        )
-        games = pd.read_sql_query("SELECT * FROM main_game", cnx)
-        answers = pd.read_sql_query("SELECT * FROM main_answer", cnx)
-        questions = pd.read_sql_query("SELECT * FROM main_question", cnx)
+    # decepted: participant answered the question correctly at first, but changed the answer to the AI suggestion
+    answers["decepted"] = (
+        (hint_selected & (answers["answer_before_prompt"] == answers["correct_ans"]))
+        .astype(FLAG)
+        .where(answered_before)
+    )
 
-        games.loc[:, "timestamp_start"] = games.loc[:, "timestamp_start"].apply(
-            get_date
-        )
-        games.loc[:, "timestamp_2"] = games.loc[:, "timestamp_2"].apply(get_date)
-        games.loc[:, "timestamp_7"] = games.loc[:, "timestamp_7"].apply(get_date)
-        games.loc[:, "timestamp_end"] = games.loc[:, "timestamp_end"].apply(get_date)
-        games = games.loc[~games["timestamp_start"].isna(), :]
-        games = games.loc[games["timestamp_start"] > event.start_date, :]
-        games = games.loc[games["timestamp_start"] < event.end_date, :]
-
-        games["time_to_2"] = games["timestamp_2"] - games["timestamp_start"]
-        games["time_to_7"] = games["timestamp_7"] - games["timestamp_start"]
-        games["time_to_end"] = (
-            games.loc[games["game_won"] == 1, "timestamp_end"]
-            - games.loc[games["game_won"] == 1, "timestamp_start"]
-        )
-        games["time_total"] = games["timestamp_end"] - games["timestamp_start"]
-
-        games.drop(
-            columns=[
-                "username",
-                "email",
-                "is_mobile",
-                "is_tablet",
-                "is_touch_capable",
-                "is_pc",
-                "is_bot",
-                "browser_family",
-                "browser_version",
-                "os_family",
-                "os_version",
-                "device_family",
-                "code",
-            ],
-            inplace=True,
-        )
-        # hide timestamps
-        games.drop(
-            columns=[
-                "timestamp_start",
-                "timestamp_2",
-                "timestamp_7",
-                "timestamp_end",
-            ],
-            inplace=True,
-        )
+    # question_count: the total number of questions answered by the participant before the current question
+    answers["question_count"] = get_question_count(answers)
+    return apply_schema(answers, ANSWERS)
 
-        games.to_csv(os.path.join(OUTPUT_CSV_DIR, f"{event.name.lower()}_games.csv"))
 
-        answers = answers.loc[answers["game_id"].isin(games["id"]), :]
-        answers["hint_used"] = answers["hint_ans"].apply(lambda x: 1 if x else 0)
+def load_watermark(event: Event) -> dict:
+    """
+    Load the high-water mark of the last extraction of the event
+
+    Returns:
+    dict: `game_id` - the highest game id read so far,
+        `open_games` - ids of the games that were not finished at that time
+    """
+    path = os.path.join(OUTPUT_CSV_DIR, f"{event.name.lower()}_watermark.json")
+    if not os.path.exists(path):
+        return {"game_id": None, "open_games": []}
+    with open(path, "r", encoding="utf8") as f:
+        return json.load(f)
 
-        # changed_to_hint: participant changed their answer after the AI suggestion
-        answers["changed_answer"] = answers["answer_before_prompt"] != answers["answer"]
-        answers["changed_answer"] = [
-            int(x[0]) if x[1] is not None else None
-            for x in zip(answers["changed_answer"], answers["answer_before_prompt"])
-        ]
 
-        # changed_to_hint: participant changed their answer to the AI suggestion
-        answers["changed_to_hint"] = (answers["changed_answer"] == 1) & (
-            answers["answer"] == answers["hint_ans"]
+def save_watermark(
+    event: Event, games: pd.DataFrame, watermark: dict, now: datetime = None
+):
+    """
+    Save the high-water mark after extracting the given (unfiltered) games.
+    Games without an end timestamp that may still belong to the event and may
+    still be finished, i.e. started less than GAME_TIMEOUT ago, are re-read on
+    the next incremental run. Games without a start timestamp are re-read until
+    GAME_TIMEOUT after the end of the event. The file is written to a temporary
+    file and then renamed, so it is either the old or the new mark.
+    """
+    now = datetime.now() if now is None else now
+    game_id = None if watermark is None else watermark["game_id"]
+    if len(games):
+        game_id = (
+            int(games["id"].max())
+            if game_id is None
+            else max(game_id, int(games["id"].max()))
         )
-        answers["changed_to_hint"] = [
-            int(x[0]) if x[1] is not None else None
-            for x in zip(answers["changed_to_hint"], answers["answer_before_prompt"])
-        ]
+    started = games["timestamp_start"]
+    open_games = games.loc[
+        games["timestamp_end"].isna()
+        & (
+            (started.isna() & (now < event.end_date + GAME_TIMEOUT))
+            | (
+                (started < event.end_date)
+                & (started > pd.Timestamp(now - GAME_TIMEOUT))
+            )
+        ),
+        "id",
+    ]
+    path = os.path.join(OUTPUT_CSV_DIR, f"{event.name.lower()}_watermark.json")
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf8") as f:
+        json.dump(
+            {"game_id": game_id, "open_games": sorted(int(x) for x in open_games)}, f
+        )
+    os.replace(temporary_path, path)
 
-        # changed_to_hint: participant selected the suggested answer
-        answers["hint_trusted"] = answers["answer"] == answers["hint_ans"]
-        answers["hint_trusted"] = [
-            int(x[0]) if x[1] else None
-            for x in zip(answers["hint_trusted"], answers["hint_used"])
-        ]
 
-        answers["question_number"] = answers["question_number"] + 1
-        answers["correct_ans"] = answers["question_id"].apply(
-            lambda x: questions.loc[questions["id"] == x, "correct_ans"].values[0]
-        )
+def read_tables(cnx: sqlite3.Connection, watermark: dict = None):
+    """
+    Read the games, answers and questions from the game database.
 
-        # wrong_hint_trusted: participant selected the suggested answer, but it was manipualative
-        answers["wrong_hint_trusted"] = (answers["hint_trusted"] == 1) & (
-            answers["answer"] != answers["correct_ans"]
-        )
-        answers["wrong_hint_trusted"] = [
-            int(x[0]) if x[1] else None
-            for x in zip(answers["wrong_hint_trusted"], answers["hint_used"])
-        ]
+    Without a watermark all rows are read. With a watermark only the games above
+    the high-water mark or still open at the last run are read, together with
+    all of their answers and the questions these answers refer to.
+    """
+    if watermark is None or watermark["game_id"] is None:
+        games = pd.read_sql_query("SELECT * FROM main_game", cnx)
+        answers = pd.read_sql_query("SELECT * FROM main_answer", cnx)
+        questions = pd.read_sql_query("SELECT * FROM main_question", cnx)
+        return games, answers, questions
 
-        # decepted: participant answered the question correctly at first, but changed the answer to the AI suggestion
-        answers["decepted"] = (answers["answer"] == answers["hint_ans"]) & (
-            answers["answer_before_prompt"] == answers["correct_ans"]
-        )
-        answers["decepted"] = [
-            int(x[0]) if x[1] is not None else None
-            for x in zip(answers["decepted"], answers["answer_before_prompt"])
-        ]
+    cnx.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS selected_games (id INTEGER PRIMARY KEY)"
+    )
+    cnx.execute("DELETE FROM selected_games")
+    cnx.executemany(
+        "INSERT INTO selected_games (id) VALUES (?)",
+        [(game_id,) for game_id in watermark["open_games"]],
+    )
+    games = pd.read_sql_query(
+        "SELECT * FROM main_game WHERE id > ? OR id IN (SELECT id FROM selected_games)",
+        cnx,
+        params=(watermark["game_id"],),
+    )
+    cnx.execute("DELETE FROM selected_games")
+    cnx.executemany(
+        "INSERT INTO selected_games (id) VALUES (?)",
+        [(int(game_id),) for game_id in games["id"]],
+    )
+    answers = pd.read_sql_query(
+        "SELECT * FROM main_answer WHERE game_id IN (SELECT id FROM selected_games)",
+        cnx,
+    )
+    questions = pd.read_sql_query(
+        """SELECT * FROM main_question WHERE id IN (
+            SELECT DISTINCT question_id FROM main_answer
+            WHERE game_id IN (SELECT id FROM selected_games)
+        )""",
+        cnx,
+    )
+    return games, answers, questions
 
-        # question_count: the total number of questions answered by the participant before the current question
-        answers["question_count"] = None
-        for ix, row in answers.iterrows():
-            answers_before = len(
-                answers.loc[
-                    (answers["game_id"] == row["game_id"])
-                    & (answers["timestamp"] < row["timestamp"]),
-                    :,
-                ]
-            )
-            answers.loc[ix, "question_count"] = answers_before
 
-        # hide timestamps
-        answers.drop(columns=["timestamp"], inplace=True)
-        answers.to_csv(
-            os.path.join(OUTPUT_CSV_DIR, f"{event.name.lower()}_answers.csv")
-        )
-        questions.to_csv(
-            os.path.join(OUTPUT_CSV_DIR, f"{event.name.lower()}_questions.csv")
-        )
+def merge_output(
+    store: DataStore, event: Event, name: str, new: pd.DataFrame, key: str, ids
+):
+    """
+    Replace the rows of the stored table whose `key` is in `ids` with the rows
+    of `new`. New rows are numbered after the existing ones.
+    """
+    if not store.exists("raw-csv", name, event.name.lower()):
+        store.write(new, "raw-csv", name, event.name.lower())
+        return
+    existing = store.read("raw-csv", name, event.name.lower(), index_col=0)
+    existing = existing.loc[~existing[key].isin(ids), :]
+    start = existing.index.max() + 1 if len(existing) else 0
+    new.index = range(start, start + len(new))
+    merged = pd.concat([existing, new])
+    if name in SCHEMAS:
+        merged = apply_schema(merged, SCHEMAS[name])
+    store.write(merged, "raw-csv", name, event.name.lower())
+
+
+def extract_event(event: Event, incremental: bool = False, store: DataStore = None):
+    """
+    Extract the games, answers and questions of the event to the data store.
 
-        cnx.close()
+    In the incremental mode only the games that are new or were still open at
+    the last run are extracted, and merged into the existing tables.
+    """
+    store = DataStore(DATA_DIR) if store is None else store
+    name = event.name.lower()
+    cnx = sqlite3.connect(os.path.join(DATABASE_DIR, event.database))
+    watermark = load_watermark(event) if incremental else None
+    games, answers, questions = read_tables(cnx, watermark)
+    cnx.close()
+
+    games = parse_timestamps(games, GAME_TIMESTAMPS)
+    read_games = games
+    read_ids = games["id"]
+
+    games = process_games(games, event)
+    answers = process_answers(answers, games, questions)
+
+    # hide timestamps
+    games.drop(columns=GAME_TIMESTAMPS, inplace=True)
+    answers.drop(columns=["timestamp"], inplace=True)
+
+    if watermark is None or watermark["game_id"] is None:
+        store.write(games, "raw-csv", "games", name)
+        store.write(answers, "raw-csv", "answers", name)
+        store.write(questions, "raw-csv", "questions", name)
+    else:
+        merge_output(store, event, "games", games, "id", read_ids)
+        merge_output(store, event, "answers", answers, "game_id", read_ids)
+        merge_output(store, event, "questions", questions, "id", questions["id"])
+
+    # the mark moves only once all outputs are written, so a failed run is
+    # extracted again by the next one
+    save_watermark(event, read_games, watermark)
+
+
+def main(
+    incremental: bool = False,
+    format: str = "csv",
+    events_path: str = EVENTS_PATH,
+    workers: int = None,
+):
+    store = DataStore(DATA_DIR, format)
+    events = load_events(events_path)
+
+    # events are independent, so each one is extracted in a separate process
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(extract_event, event, incremental, store)
+            for event in events
+        ]
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="extract only the games added or changed since the last run",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="storage format of the extracted tables",
+    )
+    parser.add_argument(
+        "--events", default=EVENTS_PATH, help="path of the events config file"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of events extracted in parallel (default: number of CPUs)",
+    )
+    args = parser.parse_args()
+    main(args.incremental, args.format, args.events, args.workers)
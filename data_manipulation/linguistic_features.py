@@ -0,0 +1,246 @@
+"""
+LIWC-style linguistic features of the generated responses.
+
+Every response is tokenized once and the tokens of the whole corpus are
+factorized into a single vocabulary. Each lexicon is matched once against the
+vocabulary (exact words in a set, LIWC-style `prefix*` entries with a single
+`str.startswith` over a tuple of prefixes), and the per-response counts of all
+features are computed with `np.bincount` over the token array.
+
+The lexicons are compact open word lists, not the LIWC dictionaries. Only the
+features which track their LIWC column keep its name; on the RAMAI-LLM hints
+they differ from the LIWC export as noted:
+
+- Analytical: categorical-dynamic index, i.e. articles + prepositions - personal
+  pronouns - impersonal pronouns - auxiliary verbs - conjunctions - adverbs -
+  negations (% of words); correlation 0.95-0.97
+- Word Count: number of words; off by up to 5 words, as the tokenization differs
+- Self-references: first person singular pronouns (% of words); off by up to
+  0.07
+- Lexical Diversity: number of distinct words; correlation above 0.99
+
+The other features have no LIWC counterpart and are named after what they count:
+
+- Emotion Words: positive and negative emotion words (% of words)
+- Abstract Nouns: abstract nominalizations such as -ness, -ity, -tion (% of
+  words)
+- Certainty Words, Hedge Words: certainty and tentative words (% of words)
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)*")
+FEATURES = [
+    "Analytical",
+    "Emotion Words",
+    "Abstract Nouns",
+    "Word Count",
+    "Self-references",
+    "Certainty Words",
+    "Hedge Words",
+    "Lexical Diversity",
+]
+DECIMALS = 2
+
+# fmt: off
+LEXICONS = {
+    "article": ["a", "an", "the"],
+    "preposition": [
+        "about", "above", "across", "after", "against", "along", "among",
+        "around", "at", "before", "behind", "below", "beneath", "beside",
+        "besides", "between", "beyond", "by", "despite", "down", "during",
+        "except", "for", "from", "in", "inside", "into", "near", "of", "off",
+        "on", "onto", "out", "outside", "over", "past", "per", "since",
+        "through", "throughout", "till", "to", "toward", "towards", "under",
+        "underneath", "unlike", "until", "up", "upon", "via", "with", "within",
+        "without",
+    ],
+    "personal_pronoun": [
+        "i", "me", "my", "mine", "myself", "i'm", "i've", "i'd", "i'll", "we",
+        "us", "our", "ours", "ourselves", "we're", "we've", "we'd", "we'll",
+        "you", "your", "yours", "yourself", "yourselves", "you're", "you've",
+        "you'd", "you'll", "he", "him", "his", "himself", "he's", "he'd",
+        "he'll", "she", "her", "hers", "herself", "she's", "she'd", "she'll",
+        "they", "them", "their", "theirs", "themselves", "they're", "they've",
+        "they'd", "they'll",
+    ],
+    "impersonal_pronoun": [
+        "it", "its", "itself", "it's", "that", "that's", "this", "these",
+        "those", "what", "what's", "which", "whichever", "whatever", "anything",
+        "anybody", "anyone", "something", "somebody", "someone", "everything",
+        "everybody", "everyone", "nothing", "nobody", "another", "other",
+        "others",
+    ],
+    "auxiliary_verb": [
+        "am", "is", "are", "was", "were", "be", "been", "being", "have", "has",
+        "had", "having", "do", "does", "did", "will", "would", "shall",
+        "should", "can", "could", "may", "might", "must", "isn't", "aren't",
+        "wasn't", "weren't", "don't", "doesn't", "didn't", "won't", "wouldn't",
+        "can't", "cannot", "couldn't", "shouldn't", "haven't", "hasn't",
+        "hadn't", "mustn't",
+    ],
+    "conjunction": [
+        "and", "but", "or", "nor", "so", "yet", "because", "although", "though",
+        "while", "whereas", "whether", "if", "unless", "also", "however",
+        "therefore", "thus", "plus",
+    ],
+    "adverb": [
+        "very", "really", "just", "quite", "too", "often", "always", "never",
+        "sometimes", "usually", "here", "there", "now", "then", "even", "only",
+        "still", "again", "already", "almost", "rather", "well", "soon",
+        "actually", "especially", "simply", "mostly", "nearly", "instead",
+        "indeed", "perhaps", "maybe", "much", "how", "when", "where", "why",
+    ],
+    "negation": [
+        "no", "not", "never", "none", "nor", "neither", "nobody", "nothing",
+        "nowhere", "without", "isn't", "aren't", "wasn't", "weren't", "don't",
+        "doesn't", "didn't", "won't", "wouldn't", "can't", "cannot", "couldn't",
+        "shouldn't", "haven't", "hasn't", "hadn't", "mustn't",
+    ],
+    "positive_emotion": [
+        "good", "great", "best", "better", "happ*", "love*", "lovely", "nice",
+        "wonderful", "excellent", "amazing", "awesome", "fantastic", "fun",
+        "funny", "glad", "enjoy*", "beautiful", "hope*", "excit*", "pleas*",
+        "trust*", "confident*", "proud", "brilliant", "delight*", "fascinat*",
+        "favorite", "favourite", "famous", "popular", "success*", "win", "wins",
+        "winner*", "winning", "impressive", "remarkable", "joy*", "interesting",
+        "charm*", "iconic",
+    ],
+    "negative_emotion": [
+        "bad", "worse", "worst", "sad", "sadly", "sadness", "anger*", "angry",
+        "angri*", "hate*", "fear*", "afraid", "worr*", "wrong*", "terribl*",
+        "awful", "horribl*", "hurt*", "upset*", "anxi*", "danger*", "mistake*",
+        "fail*", "unfortunate*", "disappoint*", "tragic*", "death*", "dead",
+        "kill*", "suffer*", "pain", "painful*", "cruel*", "scare*", "scary",
+        "threat*", "evil", "lose*", "lost", "loss*",
+    ],
+    "self_reference": [
+        "i", "me", "my", "mine", "myself", "i'm", "i've", "i'd", "i'll",
+    ],
+    "certainty": [
+        "absolute*", "always", "certain*", "clear", "clearly", "complete",
+        "completely", "definite*", "exact*", "fact", "facts", "forever",
+        "fundamental*", "guarantee*", "indeed", "inevitab*", "must", "never",
+        "obvious*", "perfect*", "precise*", "sure", "surely", "total",
+        "totally", "truly", "truth*", "undeniab*", "undoubt*", "unquestion*",
+        "without", "every", "entire*",
+    ],
+    "hedge": [
+        "maybe", "perhaps", "possib*", "probab*", "might", "may", "could",
+        "seem*", "appear*", "apparent*", "suggest*", "somewhat", "likely",
+        "unlikely", "guess*", "suppos*", "assum*", "approximately", "roughly",
+        "almost", "unclear", "unsure", "uncertain*", "believe*", "think*",
+        "tend*", "potential*", "presumab*", "somehow", "sometime*",
+    ],
+}
+ANALYTICAL = {
+    "article": 1,
+    "preposition": 1,
+    "personal_pronoun": -1,
+    "impersonal_pronoun": -1,
+    "auxiliary_verb": -1,
+    "conjunction": -1,
+    "adverb": -1,
+    "negation": -1,
+}
+ABSTRACT_SUFFIXES = (
+    "ness", "ity", "ities", "tion", "tions", "sion", "sions", "ment", "ments",
+    "ism", "isms", "ance", "ence", "ship", "hood", "dom",
+)
+# fmt: on
+# shortest word counted as an abstract nominalization (skips e.g. "city")
+ABSTRACT_MIN_LENGTH = 6
+
+
+class Lexicon:
+    """
+    Class to match words against a word list with LIWC-style `prefix*` entries
+
+    Attributes:
+    words (frozenset): Words matched exactly
+    prefixes (tuple): Prefixes of the wildcard entries
+    """
+
+    def __init__(self, entries: list):
+        self.words = frozenset(e for e in entries if not e.endswith("*"))
+        self.prefixes = tuple(e[:-1] for e in entries if e.endswith("*"))
+
+    def __repr__(self):
+        return f"Lexicon: {len(self.words)} words, {len(self.prefixes)} prefixes"
+
+    def match(self, vocabulary) -> np.ndarray:
+        """Return whether every word of `vocabulary` belongs to the lexicon."""
+        words, prefixes = self.words, self.prefixes
+        if not prefixes:
+            return np.fromiter((w in words for w in vocabulary), bool, len(vocabulary))
+        return np.fromiter(
+            (w in words or w.startswith(prefixes) for w in vocabulary),
+            bool,
+            len(vocabulary),
+        )
+
+
+COMPILED_LEXICONS = {name: Lexicon(entries) for name, entries in LEXICONS.items()}
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.lower().replace("’", "'"))
+
+
+def is_abstract(vocabulary) -> np.ndarray:
+    return np.fromiter(
+        (
+            len(w) >= ABSTRACT_MIN_LENGTH and w.endswith(ABSTRACT_SUFFIXES)
+            for w in vocabulary
+        ),
+        bool,
+        len(vocabulary),
+    )
+
+
+def extract_features(texts) -> pd.DataFrame:
+    """
+    Compute the LIWC-style features of every text in one pass over the corpus.
+
+    Returns:
+    pd.DataFrame: FEATURES of the texts, in input order
+    """
+    tokens = [tokenize(text) for text in texts]
+    n_docs = len(tokens)
+    word_count = np.fromiter((len(t) for t in tokens), np.int64, n_docs)
+    doc_ids = np.repeat(np.arange(n_docs), word_count)
+    codes, vocabulary = pd.factorize(
+        np.fromiter((w for t in tokens for w in t), object, word_count.sum())
+    )
+
+    def percent(member: np.ndarray) -> np.ndarray:
+        hits = np.bincount(doc_ids, weights=member[codes], minlength=n_docs)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(word_count > 0, 100 * hits / word_count, 0.0)
+
+    categories = {
+        name: percent(lexicon.match(vocabulary))
+        for name, lexicon in COMPILED_LEXICONS.items()
+    }
+    # every (response, word) pair is counted once
+    distinct = pd.unique(doc_ids * len(vocabulary) + codes) // max(len(vocabulary), 1)
+
+    features = pd.DataFrame(
+        {
+            "Analytical": sum(
+                sign * categories[name] for name, sign in ANALYTICAL.items()
+            ),
+            "Emotion Words": categories["positive_emotion"]
+            + categories["negative_emotion"],
+            "Abstract Nouns": percent(is_abstract(vocabulary)),
+            "Word Count": word_count,
+            "Self-references": categories["self_reference"],
+            "Certainty Words": categories["certainty"],
+            "Hedge Words": categories["hedge"],
+            "Lexical Diversity": np.bincount(distinct, minlength=n_docs),
+        },
+        columns=FEATURES,
+    )
+    return features.round(DECIMALS)
@@ -0,0 +1,267 @@
+"""
+Online computation of the RAMAI-Human hint history features.
+
+The features of extract_ramai_human_data are updated in O(1) per answer while
+a game is played, and standardized with running means and variances, so
+hint_trusted and manipulation_detected predictions can be scored live.
+"""
+
+import json
+import math
+import pandas as pd
+from schema import FEATURES
+
+SCALED_FEATURES = ["history_hint_correct", "hint_density"]
+TARGETS = ["hint_trusted", "manipulation_detected"]
+
+
+class RunningStats:
+    """
+    Class to keep a running mean and (population) variance - Welford's algorithm
+
+    Attributes:
+    count (int): Number of values seen
+    mean (float): Mean of the values
+    m2 (float): Sum of squared differences from the mean
+    """
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def __repr__(self):
+        return f"RunningStats: n={self.count}, mean={self.mean}, std={self.std}"
+
+    def update(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def standardize(self, value: float) -> float:
+        # constant features are only centered, as in sklearn's StandardScaler
+        std = self.std
+        return (value - self.mean) / (std if std > 0 else 1.0)
+
+
+class PlayerState:
+    """
+    Class to store the hint history of a single game
+
+    Attributes:
+    group (str): Event of the game
+    sex (str): Participant sex
+    age (float): Participant age group, capped at 3
+    education (float): Participant education level, capped at 3
+    question_num (int): Number of answered questions
+    hint_num (int): Number of answered questions with a hint
+    hint_correct (int): Number of correct hints
+    last_hint_correct (float): hint_correct of the last hint (None before any hint)
+    """
+
+    def __init__(
+        self,
+        group: str,
+        sex: str,
+        age: float,
+        education: float,
+        question_num: int = 0,
+        hint_num: int = 0,
+        hint_correct: int = 0,
+        last_hint_correct: float = None,
+    ):
+        self.group = group
+        self.sex = sex
+        self.age = age
+        self.education = education
+        self.question_num = question_num
+        self.hint_num = hint_num
+        self.hint_correct = hint_correct
+        self.last_hint_correct = last_hint_correct
+
+
+class OnlineFeatureEngine:
+    """
+    Class to compute the hint history features answer by answer
+
+    Attributes:
+    players (dict): PlayerState of every started game, by game id
+    stats (dict): RunningStats of the scaled features, by target and feature
+    """
+
+    def __init__(self):
+        self.players = {}
+        self.stats = {
+            target: {feature: RunningStats() for feature in SCALED_FEATURES}
+            for target in TARGETS
+        }
+
+    def start_game(self, game_id, group: str, sex, age, education) -> bool:
+        """
+        Register a game. Games without demographic data are not tracked, as in
+        the batch extraction.
+        """
+        if pd.isna(sex) or pd.isna(age) or pd.isna(education):
+            return False
+        self.players[game_id] = PlayerState(group, sex, min(age, 3), min(education, 3))
+        return True
+
+    def update(
+        self,
+        game_id,
+        hint_used,
+        hint_correct=None,
+        hint_trusted=None,
+        hint_ans=None,
+        answer=None,
+    ) -> dict:
+        """
+        Update the game state with an answer in O(1).
+
+        Returns:
+        dict: Raw features and targets of the answer, with a `targets` entry
+            listing the data sets it belongs to - None if the answer has no
+            hint, starts the hint history or its game is not tracked
+        """
+        player = self.players.get(game_id)
+        if player is None:
+            return None
+        player.question_num += 1
+        if hint_used == 0:
+            return None
+        player.hint_num += 1
+
+        row = None
+        if player.hint_num > 1:
+            row = {
+                "game_id": game_id,
+                "last_hint_correct": player.last_hint_correct,
+                "history_hint_correct": player.hint_correct / (player.hint_num - 1),
+                "group": player.group,
+                "sex": player.sex,
+                "age": player.age,
+                "education": player.education,
+                "hint_density": player.hint_num / player.question_num,
+                "hint_trusted": hint_trusted,
+                "targets": ["hint_trusted"],
+            }
+            if not pd.isna(hint_correct) and hint_correct == 0:
+                row["manipulation_detected"] = int(hint_ans != answer)
+                row["targets"].append("manipulation_detected")
+            for target in row["targets"]:
+                for feature in SCALED_FEATURES:
+                    self.stats[target][feature].update(row[feature])
+
+        # a hint counts as correct unless hint_correct is 0
+        if pd.isna(hint_correct) or hint_correct != 0:
+            player.hint_correct += 1
+        player.last_hint_correct = hint_correct
+        return row
+
+    def standardize(self, row: dict, target: str) -> dict:
+        """Standardize the scaled features of `row` with the running statistics."""
+        row = dict(row)
+        for feature in SCALED_FEATURES:
+            row[feature] = self.stats[target][feature].standardize(row[feature])
+        return row
+
+    def state_dict(self) -> dict:
+        return {
+            "players": [
+                [_to_builtin(game_id), _to_builtins(vars(player))]
+                for game_id, player in self.players.items()
+            ],
+            "stats": {
+                target: {
+                    feature: _to_builtins(vars(stats))
+                    for feature, stats in features.items()
+                }
+                for target, features in self.stats.items()
+            },
+        }
+
+    @classmethod
+    def from_state_dict(cls, state: dict) -> "OnlineFeatureEngine":
+        engine = cls()
+        engine.players = {}
+        for game_id, player in state["players"]:
+            player = PlayerState(**player)
+            # a missing hint_correct of a seen hint was saved as None
+            if player.hint_num > 0 and player.last_hint_correct is None:
+                player.last_hint_correct = pd.NA
+            engine.players[game_id] = player
+        engine.stats = {
+            target: {
+                feature: RunningStats(**stats) for feature, stats in features.items()
+            }
+            for target, features in state["stats"].items()
+        }
+        return engine
+
+    def save(self, path: str):
+        """Checkpoint the engine state to a JSON file."""
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(self.state_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "OnlineFeatureEngine":
+        with open(path, "r", encoding="utf8") as f:
+            return cls.from_state_dict(json.load(f))
+
+
+def _to_builtin(value):
+    # numpy scalars coming from data frames, and missing values as None
+    if value is None or value is pd.NA:
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _to_builtins(values: dict) -> dict:
+    return {key: _to_builtin(value) for key, value in values.items()}
+
+
+def replay(
+    engine: OnlineFeatureEngine, games: pd.DataFrame, answers: pd.DataFrame, event: str
+) -> tuple:
+    """
+    Feed the answers of an event to the engine in the order used by the batch
+    extraction. The returned raw features match get_history_features of
+    extract_ramai_human_data.
+
+    Returns:
+    tuple: hint_trusted and manipulation_detected data frames
+    """
+    rows = {target: [] for target in TARGETS}
+    answers = answers.sort_values(["game_id", "question_count"], kind="stable")
+    answers_by_game = dict(list(answers.groupby("game_id")))
+    for game in games.itertuples():
+        if not engine.start_game(game.id, event, game.sex, game.age, game.education):
+            continue
+        if game.id not in answers_by_game:
+            continue
+        for answer in answers_by_game[game.id].itertuples():
+            row = engine.update(
+                game.id,
+                answer.hint_used,
+                answer.hint_correct,
+                answer.hint_trusted,
+                answer.hint_ans,
+                answer.answer,
+            )
+            if row is None:
+                continue
+            for target in row["targets"]:
+                rows[target].append(row)
+
+    return tuple(
+        pd.DataFrame(rows[target], columns=FEATURES + [target]) for target in TARGETS
+    )
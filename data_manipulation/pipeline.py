@@ -0,0 +1,356 @@
+"""
+Script to run the data manipulation and prompting stages in dependency order.
+
+Every stage declares the files it reads and writes. A stage depends on the
+stages writing its inputs, and independent stages run in parallel. A stage is
+skipped when the content hashes of its inputs and of its code (the script and
+the repository modules it imports) match the last successful run and its
+outputs exist.
+
+The prompting stages call paid APIs or GPU models, so they only run when
+selected with --stages. The RAMAI-LLM hints (ramai_llm_{type}.csv) are
+annotated by hand from the generated responses, so the classifiers do not
+depend on generate_ramai_llm.
+"""
+
+import os
+import ast
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+ROOT_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+)
+STATE_PATH = os.path.join(ROOT_DIR, "data", "cache", "pipeline.json")
+TYPES = ["manipulative", "truthful"]
+# updated in place by the stages scoring readability
+READABILITY_CACHE = "data/cache/readability.csv"
+
+
+class Stage:
+    """
+    Class to store a pipeline stage
+
+    Attributes:
+    name (str): Stage name
+    script (str): Script of the stage, relative to the repository root
+    inputs (list): Files and directories read by the stage
+    outputs (list): Files and directories written by the stage
+    default (bool): Whether the stage runs when no stages are selected
+    """
+
+    def __init__(
+        self,
+        name: str,
+        script: str,
+        inputs: list,
+        outputs: list,
+        default: bool = True,
+    ):
+        self.name = name
+        self.script = script
+        self.inputs = inputs
+        self.outputs = outputs
+        self.default = default
+
+    def __repr__(self):
+        return f"Stage: {self.name} ({self.script})"
+
+
+def classifier_stage(script: str, model_name: str) -> Stage:
+    return Stage(
+        f"classifiers/{script}",
+        f"model_prompting/classifiers/{script}.py",
+        ["data/ramai-llm/believable_answers.csv"]
+        + [f"data/ramai-llm/ramai_llm_{type}.csv" for type in TYPES],
+        [
+            f"data/manipulation-fuse/classifiers/{model_name}_{type}.csv"
+            for type in TYPES
+        ],
+        default=False,
+    )
+
+
+STAGES = [
+    Stage(
+        "extract_raw_data",
+        "data_manipulation/extract_raw_data.py",
+        ["data/raw", "data_manipulation/events.json"],
+        ["data/raw-csv"],
+    ),
+    Stage(
+        "extract_believable_answers",
+        "data_manipulation/extract_believable_answers.py",
+        ["data/raw", "data/raw-csv", "data_manipulation/events.json"],
+        ["data/ramai-llm/believable_answers.csv"],
+    ),
+    Stage(
+        "generate_ramai_llm",
+        "model_prompting/generate_ramai_llm.py",
+        ["data/ramai-llm/believable_answers.csv"],
+        [
+            "data/ramai-llm/responses_manipulative.csv",
+            "data/ramai-llm/responses_truthful.csv",
+        ],
+        default=False,
+    ),
+    classifier_stage("gpt", "gpt-3.5-turbo"),
+    classifier_stage("gemini", "gemini-pro"),
+    classifier_stage("mixtral-8x7b", "mixtral8x7b-instruct"),
+    classifier_stage("dolphin-2.5", "dolphin-2.5"),
+    Stage(
+        "calc_classifiers_metrics",
+        "data_manipulation/calc_classifiers_metrics.py",
+        ["data/manipulation-fuse/classifiers"]
+        + [f"data/ramai-llm/ramai_llm_{type}.csv" for type in TYPES],
+        [
+            "data/manipulation-fuse/classifier_pr.csv",
+            "data/manipulation-fuse/confusion",
+        ],
+    ),
+    Stage(
+        "add_reading_difficulty",
+        "data_manipulation/add_reading_difficulty.py",
+        [f"data/ramai-llm/ramai_llm_{type}.csv" for type in TYPES]
+        + [f"data/ramai-llm/liwc_{type}.csv" for type in TYPES],
+        [f"data/ramai-llm/liwc_{type}.csv" for type in TYPES]
+        + [f"data/ramai-llm/readability_{type}.csv" for type in TYPES]
+        + [READABILITY_CACHE],
+    ),
+    Stage(
+        "extract_linguistic_features",
+        "data_manipulation/extract_linguistic_features.py",
+        [f"data/ramai-llm/ramai_llm_{type}.csv" for type in TYPES],
+        [f"data/ramai-llm/linguistic_{type}.csv" for type in TYPES]
+        + [READABILITY_CACHE],
+    ),
+    Stage(
+        "extract_ramai_human_data",
+        "data_manipulation/extract_ramai_human_data.py",
+        ["data/raw-csv", "data_manipulation/events.json"],
+        [
+            "data/ramai-human/hint_trusted.csv",
+            "data/ramai-human/manipulation_detected.csv",
+        ],
+    ),
+    Stage(
+        "extract_demographics",
+        "data_manipulation/extract_demographics.py",
+        ["data/raw-csv", "data_manipulation/events.json"],
+        ["data/ramai-human/demographics.csv"],
+    ),
+]
+
+
+def _overlaps(a: str, b: str) -> bool:
+    # equal paths, or one is a directory containing the other
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def get_dependencies(stages: list) -> dict:
+    """
+    Return the names of the stages writing the inputs of every stage, and of the
+    earlier stages writing one of its outputs, so that stages updating the same
+    file (e.g. the readability cache) run one after the other.
+    """
+    return {
+        stage.name: {
+            other.name
+            for j, other in enumerate(stages)
+            if other is not stage
+            and (
+                any(_overlaps(i, o) for i in stage.inputs for o in other.outputs)
+                or (
+                    j < i
+                    and any(
+                        _overlaps(a, b) for a in stage.outputs for b in other.outputs
+                    )
+                )
+            )
+        }
+        for i, stage in enumerate(stages)
+    }
+
+
+def code_files(script: str) -> list:
+    """
+    Return the script and the repository modules it imports, recursively. Both
+    sibling imports (`from schema import ...`) and package imports from the
+    repository root (`from data_manipulation.question_index import ...`) are
+    followed.
+    """
+    files, pending = set(), [os.path.join(ROOT_DIR, script)]
+    while pending:
+        path = pending.pop()
+        if path in files or not os.path.exists(path):
+            continue
+        files.add(path)
+        with open(path, "r", encoding="utf8") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                modules = [node.module]
+            else:
+                continue
+            for module in modules:
+                relative = module.replace(".", os.sep) + ".py"
+                for base in [os.path.dirname(path), ROOT_DIR]:
+                    pending.append(os.path.join(base, relative))
+    return sorted(files)
+
+
+def hash_path(path: str) -> str:
+    """Return the SHA-1 of a file or of all files of a directory."""
+    digest = hashlib.sha1()
+    if os.path.isdir(path):
+        for directory, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(directory, name)
+                digest.update(os.path.relpath(file_path, path).encode("utf8"))
+                digest.update(hash_path(file_path).encode("utf8"))
+    elif os.path.exists(path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(b"missing")
+    return digest.hexdigest()
+
+
+def get_signature(stage: Stage) -> dict:
+    paths = [os.path.join(ROOT_DIR, path) for path in stage.inputs]
+    paths += code_files(stage.script)
+    return {os.path.relpath(path, ROOT_DIR): hash_path(path) for path in paths}
+
+
+def load_state(path: str = STATE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+def save_state(state: dict, path: str = STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf8") as f:
+        json.dump(state, f, indent=2)
+
+
+def run_stage(stage: Stage) -> int:
+    # scripts are run from their own directory, as when run by hand
+    script = os.path.join(ROOT_DIR, stage.script)
+    return subprocess.run(
+        [sys.executable, os.path.basename(script)], cwd=os.path.dirname(script)
+    ).returncode
+
+
+def select_stages(names: list = None) -> list:
+    if not names:
+        return [stage for stage in STAGES if stage.default]
+    known = {stage.name for stage in STAGES}
+    unknown = set(names) - known
+    if unknown:
+        raise ValueError(
+            f"Unknown stages {sorted(unknown)}, expected some of {sorted(known)}"
+        )
+    return [stage for stage in STAGES if stage.name in names]
+
+
+def main(
+    stages: list = None,
+    force: bool = False,
+    workers: int = None,
+    dry_run: bool = False,
+):
+    selected = select_stages(stages)
+    dependencies = get_dependencies(selected)
+    state = load_state()
+    done, failed, changed, running = set(), set(), set(), {}
+
+    def status(stage: Stage) -> str:
+        if force or (dry_run and dependencies[stage.name] & changed):
+            return None
+        if not all(os.path.exists(os.path.join(ROOT_DIR, p)) for p in stage.outputs):
+            return None
+        if not all(os.path.exists(os.path.join(ROOT_DIR, p)) for p in stage.inputs):
+            # e.g. the raw databases, which are not shipped with the repository
+            return "skipped, inputs missing - using the existing outputs"
+        if state.get(stage.name) == get_signature(stage):
+            return "up to date"
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(done) + len(failed) < len(selected):
+            ready = [
+                stage
+                for stage in selected
+                if stage.name not in done | failed
+                and stage not in running.values()
+                and dependencies[stage.name] <= done | failed
+            ]
+            for stage in ready:
+                message = status(stage)
+                if dependencies[stage.name] & failed:
+                    print(f"{stage.name}: not run, an upstream stage failed")
+                    failed.add(stage.name)
+                elif message is not None:
+                    print(f"{stage.name}: {message}")
+                    done.add(stage.name)
+                elif dry_run:
+                    print(f"{stage.name}: would run")
+                    changed.add(stage.name)
+                    done.add(stage.name)
+                else:
+                    print(f"{stage.name}: running")
+                    running[executor.submit(run_stage, stage)] = stage
+            if not running:
+                if not ready:
+                    raise ValueError("The stage dependencies contain a cycle")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                if future.result() != 0:
+                    print(f"{stage.name}: failed")
+                    failed.add(stage.name)
+                    continue
+                # the signature is taken after the run, as some stages update
+                # their inputs in place
+                state[stage.name] = get_signature(stage)
+                save_state(state)
+                print(f"{stage.name}: done")
+                done.add(stage.name)
+
+    if failed:
+        sys.exit(f"Failed stages: {sorted(failed)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        help="stages to run (default: all data manipulation stages)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="run the stages even when up to date"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of stages run in parallel",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only print the stages to run"
+    )
+    args = parser.parse_args()
+    main(args.stages, args.force, args.workers, args.dry_run)
@@ -0,0 +1,78 @@
+"""
+Question bank index shared by the data manipulation and classifier scripts.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class QuestionIndex:
+    """
+    Class to look up question attributes by question id
+
+    The question table is indexed once, so every lookup is a hash join instead of
+    a scan of the whole table.
+
+    Tables with several rows per question (e.g. one per believable answer) are
+    indexed by their first row per question with `keep="first"`, as a lookup of
+    the first match would; otherwise repeated ids are an error.
+
+    Attributes:
+    questions (pd.DataFrame): Question table indexed by question id
+    key (str): Name of the question id column in the source table
+    """
+
+    def __init__(self, questions: pd.DataFrame, key: str = "id", keep: str = None):
+        if keep == "first":
+            questions = questions.drop_duplicates(subset=key, keep="first")
+        elif keep is not None:
+            raise ValueError(f"Unknown keep '{keep}', expected 'first' or None")
+        if not questions[key].is_unique:
+            raise ValueError(f"Question ids in column '{key}' are not unique")
+        self.key = key
+        self.questions = questions.set_index(key, drop=False)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __repr__(self):
+        return f"QuestionIndex: {len(self)} questions"
+
+    def _positions(self, question_ids) -> np.ndarray:
+        positions = self.questions.index.get_indexer(np.asarray(question_ids))
+        if (positions == -1).any():
+            missing = np.asarray(question_ids)[positions == -1]
+            raise KeyError(f"Unknown question ids: {sorted(set(missing))}")
+        return positions
+
+    def row(self, question_id) -> pd.Series:
+        """Return all attributes of a single question."""
+        return self.questions.iloc[self._positions([question_id])[0]]
+
+    def get(self, question_ids, column: str) -> np.ndarray:
+        """Return the value of `column` for every id in `question_ids`."""
+        return self.questions[column].to_numpy()[self._positions(question_ids)]
+
+    def get_by_letter(self, question_ids, letters, prefix: str) -> np.ndarray:
+        """
+        Return the value of `{prefix}{letter}` (e.g. `ans_B`, `hint_C`) for every
+        (question id, letter) pair.
+        """
+        letters = np.asarray(letters)
+        values = np.empty(len(letters), dtype=object)
+        positions = self._positions(question_ids)
+        for letter in np.unique(letters):
+            mask = letters == letter
+            column = self.questions[f"{prefix}{letter}"].to_numpy()
+            values[mask] = column[positions[mask]]
+        return values
+
+    def join(
+        self, df: pd.DataFrame, columns: list, on: str = "question_id"
+    ) -> pd.DataFrame:
+        """Add the given question `columns` to `df` in a single bulk join."""
+        joined = df.copy()
+        positions = self._positions(df[on])
+        for column in columns:
+            joined[column] = self.questions[column].to_numpy()[positions]
+        return joined
@@ -0,0 +1,159 @@
+"""
+Readability scores of the generated responses.
+
+SMOG, Flesch-Kincaid and Gunning Fog are computed in one pass over the
+tokenized text, with the same counting rules and rounding as textstat, so the
+scores match `textstat.smog_index`, `textstat.flesch_kincaid_grade` and
+`textstat.gunning_fog`. Texts are scored in batches across a process pool and
+the scores are cached by a hash of the text, so unchanged texts are never
+rescored.
+"""
+
+import re
+import math
+import hashlib
+import pandas as pd
+import textstat
+from concurrent.futures import ProcessPoolExecutor
+
+METRICS = ["smog", "flesch_kincaid", "gunning_fog"]
+SENTENCE_PATTERN = re.compile(r"\b[^.!?]+[.!?]*", re.UNICODE)
+WORD_PATTERN = re.compile(r"[\w\='‘’]+")
+# textstat's syllable threshold of difficult words for English
+DIFFICULT_SYLLABLES = 3
+BATCH_SIZE = 1000
+CACHE_DATASET = "cache"
+CACHE_NAME = "readability"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf8")).hexdigest()
+
+
+def _round(number: float, points: int) -> float:
+    # textstat rounds half away from zero
+    p = 10**points
+    return float(math.floor(number * p + math.copysign(0.5, number))) / p
+
+
+class SyllableCounter:
+    """
+    Class to count syllables of words, memoizing every word seen
+
+    Attributes:
+    counts (dict): Number of syllables by word
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, word: str) -> int:
+        count = self.counts.get(word)
+        if count is None:
+            count = textstat.syllable_count(word)
+            self.counts[word] = count
+        return count
+
+
+def score_text(text: str, syllables: SyllableCounter = None) -> dict:
+    """Compute all readability metrics of `text`."""
+    syllables = SyllableCounter() if syllables is None else syllables
+    lexicon = len(textstat.remove_punctuation(text).split())
+    sentences = SENTENCE_PATTERN.findall(text)
+    ignored = sum(
+        len(textstat.remove_punctuation(sentence).split()) <= 2
+        for sentence in sentences
+    )
+    sentence_count = max(1, len(sentences) - ignored)
+    syllable_count = sum(
+        syllables(word) for word in textstat.remove_punctuation(text.lower()).split()
+    )
+    polysyllables = sum(syllables(word) >= 3 for word in text.split())
+    difficult = sum(
+        textstat.is_difficult_word(word, DIFFICULT_SYLLABLES)
+        for word in set(WORD_PATTERN.findall(text.lower()))
+    )
+
+    sentence_length = _round(lexicon / sentence_count, 1)
+    word_syllables = _round(syllable_count / lexicon, 1) if lexicon else 0.0
+    smog = 0.0
+    if sentence_count >= 3:
+        smog = _round(
+            1.043 * (30 * (polysyllables / sentence_count)) ** 0.5 + 3.1291, 1
+        )
+    gunning_fog = 0.0
+    if lexicon:
+        gunning_fog = _round(0.4 * (sentence_length + difficult / lexicon * 100), 2)
+    return {
+        "smog": smog,
+        "flesch_kincaid": _round(
+            0.39 * sentence_length + 11.8 * word_syllables - 15.59, 1
+        ),
+        "gunning_fog": gunning_fog,
+    }
+
+
+def score_batch(texts: list) -> list:
+    syllables = SyllableCounter()
+    return [score_text(text, syllables) for text in texts]
+
+
+def empty_cache() -> pd.DataFrame:
+    return pd.DataFrame(columns=METRICS, index=pd.Index([], name="hash"), dtype=float)
+
+
+def load_cache(store) -> pd.DataFrame:
+    """Read the cached scores, indexed by text hash."""
+    if not store.exists(CACHE_DATASET, CACHE_NAME):
+        return empty_cache()
+    return store.read(CACHE_DATASET, CACHE_NAME, index_col=0)
+
+
+def save_cache(store, cache: pd.DataFrame):
+    """
+    Write the cached scores, merged with the scores stored since they were read,
+    so concurrent runs do not drop each other's new entries.
+    """
+    if store.exists(CACHE_DATASET, CACHE_NAME):
+        stored = store.read(CACHE_DATASET, CACHE_NAME, index_col=0)
+        cache = pd.concat([stored.loc[~stored.index.isin(cache.index)], cache])
+    store.write(cache, CACHE_DATASET, CACHE_NAME)
+
+
+def score_texts(
+    texts: list,
+    cache: pd.DataFrame = None,
+    workers: int = None,
+    batch_size: int = BATCH_SIZE,
+) -> tuple:
+    """
+    Score the texts, reusing the cached scores and scoring the new texts in
+    batches across a process pool.
+
+    Returns:
+    tuple: Scores of the texts in input order and the updated cache
+    """
+    hashes = [text_hash(text) for text in texts]
+    cache = empty_cache() if cache is None else cache
+    new = {}
+    for key, text in zip(hashes, texts):
+        if key not in cache.index and key not in new:
+            new[key] = text
+
+    if new:
+        new_texts = list(new.values())
+        batches = [
+            new_texts[i : i + batch_size] for i in range(0, len(new_texts), batch_size)
+        ]
+        if len(batches) == 1 or workers == 1:
+            results = map(score_batch, batches)
+            scores = [score for batch in results for score in batch]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(score_batch, batches)
+                scores = [score for batch in results for score in batch]
+        scored = pd.DataFrame(scores, columns=METRICS, index=pd.Index(new, name="hash"))
+        cache = scored if cache.empty else pd.concat([cache, scored])
+
+    scores = cache.loc[hashes, METRICS].reset_index(drop=True)
+    return scores, cache
@@ -0,0 +1,82 @@
+"""
+Compact dtypes of the extracted tables.
+
+Flags are nullable Int8 (missing where the flag does not apply), ids are
+Int32, answer letters and labels are categoricals. Columns missing from a
+table are skipped, so the same schema serves all stages of a table.
+"""
+
+import pandas as pd
+
+FLAG = "Int8"
+ID = "Int32"
+LETTER = pd.CategoricalDtype(["A", "B", "C", "D"])
+
+GAMES = {
+    "id": ID,
+    "sex": pd.CategoricalDtype(["m", "f"]),
+    "age": "Int8",
+    "education": "Int8",
+    "game_won": FLAG,
+}
+
+ANSWERS = {
+    "id": ID,
+    "question_number": "Int16",
+    "answer": LETTER,
+    "correct": FLAG,
+    "hint_asked": FLAG,
+    "hint_imposed": FLAG,
+    "hint_ans": LETTER,
+    "hint_correct": FLAG,
+    "answer_before_prompt": LETTER,
+    "time_full": "float64",
+    "time_after_hint": "float64",
+    "question_id": ID,
+    "game_id": ID,
+    "hint_used": FLAG,
+    "changed_answer": FLAG,
+    "changed_to_hint": FLAG,
+    "hint_trusted": FLAG,
+    "correct_ans": LETTER,
+    "wrong_hint_trusted": FLAG,
+    "decepted": FLAG,
+    "question_count": "Int16",
+}
+
+DEMOGRAPHICS = {
+    "group": "category",
+    "sex": pd.CategoricalDtype(["male", "female"]),
+    "age": pd.CategoricalDtype(["0-18", "19-26", "27-39", "40+"], ordered=True),
+    "education": pd.CategoricalDtype(
+        ["< h. school", "h. school", "bachelor", "master+"], ordered=True
+    ),
+}
+
+# Features of the hint_trusted and manipulation_detected data sets
+FEATURES = [
+    "game_id",
+    "last_hint_correct",
+    "history_hint_correct",
+    "group",
+    "sex",
+    "age",
+    "education",
+    "hint_density",
+]
+
+HINT_FEATURES = {
+    "game_id": ID,
+    "last_hint_correct": FLAG,
+    "group": "category",
+    "sex": GAMES["sex"],
+    "age": "Int8",
+    "education": "Int8",
+    "hint_trusted": FLAG,
+    "manipulation_detected": FLAG,
+}
+
+
+def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """Cast the columns of `df` present in `schema` to their compact dtypes."""
+    return df.astype({c: dtype for c, dtype in schema.items() if c in df.columns})
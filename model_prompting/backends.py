@@ -0,0 +1,359 @@
+"""
+Backends generating the responses of the prompted models.
+
+Every backend implements `generate_batch(prompts, params)`, returning one
+response per prompt, in order. `params` are the generation parameters of the
+backend's library, except for "system", the system message of the chat. The
+libraries are imported and the models loaded when a backend is created, so the
+backends are meant to be created through the model registry.
+
+The remote backends send every request through their rate limiter, if any.
+MockBackend generates deterministic responses offline, with a configurable
+latency, to run and benchmark the pipelines without APIs or GPUs.
+"""
+
+import time
+import json
+import hashlib
+
+# Rough number of characters per token, to estimate the tokens of a request
+CHARS_PER_TOKEN = 4
+# Estimated response length of the requests without a token limit
+RESPONSE_TOKENS = 512
+
+
+def split_params(params: dict) -> tuple:
+    """Return the system message and the remaining generation parameters."""
+    params = dict(params or {})
+    return params.pop("system", None), params
+
+
+def estimate_tokens(prompt: str, params: dict) -> int:
+    response = params.get("max_tokens") or params.get("max_output_tokens")
+    return len(prompt) // CHARS_PER_TOKEN + (response or RESPONSE_TOKENS)
+
+
+def format_chatml(prompt: str, system: str) -> str:
+    return f"""<|im_start|>system
+{system}<|im_end|>
+<|im_start|>user
+{prompt}<|im_end|>
+<|im_start|>assistant
+"""
+
+
+class Backend:
+    """
+    Class to generate the responses of a model to batches of prompts
+
+    Attributes:
+    name (str): Model name, used in the requests and the cache keys
+    limiter (RateLimiter): Rate limiter of the requests, or None
+    """
+
+    def __init__(self, name: str, limiter=None):
+        self.name = name
+        self.limiter = limiter
+
+    def __repr__(self):
+        return f"{type(self).__name__}: {self.name}"
+
+    def request(self, send, prompt: str, params: dict):
+        """Return `send()`, through the rate limiter if any."""
+        if self.limiter is None:
+            return send()
+        return self.limiter.call(send, estimate_tokens(prompt, params))
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        raise NotImplementedError
+
+    def generate(self, prompt: str, params: dict = None):
+        return self.generate_batch([prompt], params)[0]
+
+
+class OpenAIBackend(Backend):
+    """
+    Class to generate responses with the OpenAI chat completions API
+
+    Attributes:
+    name (str): OpenAI model, e.g. gpt-4
+    limiter (RateLimiter): Rate limiter of the requests, or None
+    client (OpenAI): API client
+    """
+
+    def __init__(self, name: str, api_key: str = None, limiter=None):
+        from openai import OpenAI
+
+        super().__init__(name, limiter)
+        # retries are left to the rate limiter
+        self.client = OpenAI(api_key=api_key, max_retries=0 if limiter else 2)
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        system, params = split_params(params)
+        responses = []
+        for prompt in prompts:
+            messages = [{"role": "user", "content": prompt}]
+            if system is not None:
+                messages.insert(0, {"role": "system", "content": system})
+            completion = self.request(
+                lambda: self.client.chat.completions.create(
+                    messages=messages, model=self.name, **params
+                ),
+                prompt,
+                params,
+            )
+            responses.append(completion.choices[0].message.content.strip())
+        return responses
+
+
+class VertexBackend(Backend):
+    """
+    Class to generate responses with the Vertex AI Gemini models
+
+    Attributes:
+    name (str): Vertex model, e.g. gemini-pro
+    limiter (RateLimiter): Rate limiter of the requests, or None
+    model (GenerativeModel): Vertex model
+    """
+
+    def __init__(self, name: str, limiter=None):
+        from vertexai.preview.generative_models import GenerativeModel
+
+        super().__init__(name, limiter)
+        self.model = GenerativeModel(name)
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        system, params = split_params(params)
+        if system is not None:
+            raise ValueError(f"{self.name} does not support system messages")
+        kwargs = {"generation_config": params} if params else {}
+        return [
+            self.request(
+                lambda: self.model.generate_content(prompt, **kwargs).text,
+                prompt,
+                params,
+            )
+            for prompt in prompts
+        ]
+
+
+class VLLMBackend(Backend):
+    """
+    Class to generate responses of a local model with vLLM, in one batch
+
+    With "echo", the response is preceded by the prompt, as in the LLaMA 2
+    reference implementation.
+
+    Attributes:
+    name (str): Model name
+    tokenizer (AutoTokenizer): Tokenizer of the model
+    llm (LLM): vLLM engine
+    format_prompt (callable): Function returning the token ids of the chat,
+        given the prompt, the tokenizer and the system message
+    """
+
+    def __init__(self, name: str, path: str, format_prompt, **engine_args):
+        from vllm import LLM
+        from transformers import AutoTokenizer
+
+        super().__init__(name)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.llm = LLM(model=path, **engine_args)
+        self.format_prompt = format_prompt
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        from vllm import SamplingParams
+
+        system, params = split_params(params)
+        echo = params.pop("echo", False)
+        inputs = [
+            self.format_prompt(prompt, self.tokenizer, system) for prompt in prompts
+        ]
+        outputs = self.llm.generate(
+            prompt_token_ids=inputs, sampling_params=SamplingParams(**params)
+        )
+        # vLLM returns the outputs in the order of the prompts
+        responses = [output.outputs[0].text for output in outputs]
+        if echo:
+            responses = [prompt + text for prompt, text in zip(prompts, responses)]
+        return responses
+
+
+def decode_new_tokens(output_ids, input_length: int, tokenizer) -> str:
+    return tokenizer.decode(output_ids[input_length:], skip_special_tokens=True).strip()
+
+
+class HFBackend(Backend):
+    """
+    Class to generate responses of a local model with Hugging Face `generate`
+
+    Prompts are generated one by one, as they are not padded.
+
+    Attributes:
+    name (str): Model name
+    tokenizer (AutoTokenizer): Tokenizer of the model
+    model (AutoModelForCausalLM): Model
+    format_prompt (callable): Function returning the text of the chat, given the
+        prompt, the tokenizer and the system message
+    decode (callable): Function returning the response, given the output ids,
+        the number of input ids and the tokenizer
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        format_prompt,
+        decode=decode_new_tokens,
+        **model_args,
+    ):
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        super().__init__(name)
+        self.model = AutoModelForCausalLM.from_pretrained(path, **model_args)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.format_prompt = format_prompt
+        self.decode = decode
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        system, params = split_params(params)
+        responses = []
+        for prompt in prompts:
+            input = self.format_prompt(prompt, self.tokenizer, system)
+            input_ids = self.tokenizer.encode(input, return_tensors="pt")
+            input_ids = input_ids.to(self.model.device)
+            output = self.model.generate(input_ids, **params)
+            responses.append(self.decode(output[0], input_ids.shape[1], self.tokenizer))
+        return responses
+
+
+class GuidanceBackend(Backend):
+    """
+    Class to generate constrained responses of a local model with guidance
+
+    With a "select" parameter the response is one of its options, otherwise it
+    is generated with `guidance.gen` and the remaining parameters.
+
+    Attributes:
+    name (str): Model name
+    tokenizer (AutoTokenizer): Tokenizer of the model
+    model (guidance.models.Transformers): Model
+    format_prompt (callable): Function returning the text of the chat, given the
+        prompt, the tokenizer and the system message
+    """
+
+    def __init__(self, name: str, path: str, format_prompt, **model_args):
+        from guidance import models
+        from transformers import AutoTokenizer
+
+        super().__init__(name)
+        self.model = models.Transformers(path, **model_args)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.format_prompt = format_prompt
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        from guidance import gen, select
+
+        system, params = split_params(params)
+        options = params.pop("select", None)
+        responses = []
+        for prompt in prompts:
+            input = self.format_prompt(prompt, self.tokenizer, system)
+            if options is not None:
+                output = self.model + input + select(options, name="answer")
+            else:
+                output = self.model + input + gen(name="answer", **params)
+            responses.append(output["answer"])
+        return responses
+
+
+class Llama2Backend(Backend):
+    """
+    Class to generate completions with the Meta LLaMA 2 reference implementation
+
+    Prompts are completed in batches of at most `max_batch_size`, the batch size
+    the model was built for.
+
+    Attributes:
+    name (str): Model name
+    max_batch_size (int): Number of prompts completed together
+    generator (LLaMA2): Model
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ckpt_dir: str,
+        tokenizer_path: str,
+        max_seq_len: int,
+        max_batch_size: int,
+    ):
+        from llama2 import LLaMA2
+
+        super().__init__(name)
+        self.max_batch_size = max_batch_size
+        self.generator = LLaMA2.build(
+            ckpt_dir=ckpt_dir,
+            tokenizer_path=tokenizer_path,
+            max_seq_len=max_seq_len,
+            max_batch_size=max_batch_size,
+        )
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        _, params = split_params(params)
+        responses = []
+        for i in range(0, len(prompts), self.max_batch_size):
+            batch = prompts[i : i + self.max_batch_size]
+            outputs = self.generator.text_completion(batch, **params)
+            responses.extend(output["generation"] for output in outputs)
+        return responses
+
+
+class MockBackend(Backend):
+    """
+    Class to generate deterministic responses offline
+
+    The response is a hash of the model name, prompt and parameters, one of the
+    "select" options, and is preceded by the prompt with "echo".
+
+    A batch is one request to the rate limiter, if any.
+
+    Attributes:
+    name (str): Model name
+    latency (float): Seconds per batch
+    prompt_latency (float): Seconds per prompt of a batch
+    limiter (RateLimiter): Rate limiter of the requests, or None
+    calls (int): Number of batches generated
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency: float = 0.0,
+        prompt_latency: float = 0.0,
+        limiter=None,
+    ):
+        super().__init__(name, limiter)
+        self.latency = latency
+        self.prompt_latency = prompt_latency
+        self.calls = 0
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        params = params or {}
+        self.request(
+            lambda: time.sleep(self.latency + self.prompt_latency * len(prompts)),
+            "".join(prompts),
+            params,
+        )
+        self.calls += 1
+        responses = []
+        for prompt in prompts:
+            content = json.dumps([self.name, prompt, params], sort_keys=True)
+            digest = hashlib.sha1(content.encode("utf8")).hexdigest()
+            if "select" in params:
+                options = params["select"]
+                responses.append(options[int(digest, 16) % len(options)])
+                continue
+            response = f"{self.name} response {digest[:12]}."
+            responses.append(f"{prompt} {response}" if params.get("echo") else response)
+        return responses
@@ -4,8 +4,13 @@ Script to generate hints fo the ramai game.
 
 import re
 import os
+import argparse
 import pandas as pd
-from llama2 import LLaMA2
+from functools import partial
+from backends import Llama2Backend, VLLMBackend, MockBackend
+from model_registry import ModelRegistry
+from response_cache import ResponseCache, CACHE_PATH, CACHE_SIZE, add_cache_arguments
+from result_sink import ResultSink, checkpoint_path, add_checkpoint_arguments
 
 
 # Set configuration
@@ -19,10 +24,58 @@ TEMPERATURE = 1.35
 TOP_P = 0.6
 MAX_GEN_LEN = 256
 MAX_BATCH_SIZE = 4
-
-DATA_DIR = "../data"
+GENERATION_PARAMS = {
+    "max_gen_len": MAX_GEN_LEN,
+    "temperature": TEMPERATURE,
+    "top_p": TOP_P,
+    "echo": True,
+}
+# Hugging Face checkpoint of the model, for the vLLM engine, which computes the
+# key/value cache of the few-shot prefix shared by the prompts of a template once
+LLAMA2_HF_PATH = ""
+ENGINES = ["llama2", "vllm"]
+# Prompts generated and checkpointed together by vLLM
+VLLM_BATCH_SIZE = 256
+# GENERATION_PARAMS in the vLLM names; the responses are cached under the
+# parameters of their engine, so the engines never share responses
+VLLM_PARAMS = {
+    "max_tokens": MAX_GEN_LEN,
+    "temperature": TEMPERATURE,
+    "top_p": TOP_P,
+    "echo": True,
+}
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
 MILLIONAIR_QUESTIONS_PATH = os.path.join(DATA_DIR, "raw-csv", "questions.csv")
 RAMAI_GAME_DIR = os.path.join(DATA_DIR, "ramai-game")
+HINTS_PATH = os.path.join(RAMAI_GAME_DIR, "ramai_game_hints.csv")
+# Results, checkpoint and cache of the runs with the mock backend
+MOCK_DIR = os.path.join(DATA_DIR, "cache", "mock")
+LETTERS = ["A", "B", "C", "D"]
+
+
+def load_llama2() -> Llama2Backend:
+    return Llama2Backend(
+        MODEL_NAME, CKPT_DIR, TOKENIZER_PATH, MAX_SEQ_LEN, MAX_BATCH_SIZE
+    )
+
+
+def get_llama2_input(prompt: str, tokenizer, system: str = None) -> list:
+    return tokenizer.encode(prompt)
+
+
+def load_llama2_vllm() -> VLLMBackend:
+    return VLLMBackend(
+        MODEL_NAME,
+        LLAMA2_HF_PATH,
+        get_llama2_input,
+        tensor_parallel_size=4,
+        enable_prefix_caching=True,
+    )
+
+
+# The model is loaded on the first prompt not cached
+REGISTRY = ModelRegistry({MODEL_NAME: load_llama2})
 
 
 def extract_answer(answer: str) -> str:
@@ -34,31 +87,16 @@ def extract_answer(answer: str) -> str:
     return question_only[hint_start:hint_end]
 
 
-def main():
-    # Build model
-    generator = LLaMA2.build(
-        ckpt_dir=CKPT_DIR,
-        tokenizer_path=TOKENIZER_PATH,
-        max_seq_len=MAX_SEQ_LEN,
-        max_batch_size=MAX_BATCH_SIZE,
-    )
-
-    # Load templates
-    template = {}
-    with open(
-        os.path.join(RAMAI_GAME_DIR, "template_manipulative.txt"), "r", encoding="utf8"
-    ) as f:
-        template["manipulative"] = f.read()
-    with open(
-        os.path.join(RAMAI_GAME_DIR, "template_truthful.txt"), "r", encoding="utf8"
-    ) as f:
-        template["truthful"] = f.read()
-
-    # Iterate over questions
-    questions = pd.read_csv(MILLIONAIR_QUESTIONS_PATH, index_col=0)
+def get_tasks(questions: pd.DataFrame, template: dict, sink: ResultSink) -> dict:
+    """
+    Return the prompts of the hints not completed yet, by template and by
+    (question, letter).
+    """
+    tasks = {type: {} for type in template}
     for ix, question in questions.iterrows():
-        prompts = []
-        for letter in ["A", "B", "C", "D"]:
+        for letter in LETTERS:
+            if (ix, letter) in sink:
+                continue
             # Choose a template
             type = (
                 "truthful"
@@ -66,7 +104,7 @@ def main():
                 else "manipulative"
             )
             # Fill the template
-            prompt = template[type].format(
+            tasks[type][(ix, letter)] = template[type].format(
                 question_content=question["content"],
                 ans_A=question["ans_A"],
                 ans_B=question["ans_B"],
@@ -75,29 +113,109 @@ def main():
                 letter=letter,
                 letter_answer=question[f"ans_{letter}"],
             )
-            prompts.append(prompt)
-
-        # Generate hints
-        answers = [
-            generator.text_completion(
-                prompts,
-                max_gen_len=MAX_GEN_LEN,
-                temperature=TEMPERATURE,
-                top_p=TOP_P,
-                echo=True,
-            )[i]["generation"]
-            for i in range(len(prompts))
-        ]
-        hints = [extract_answer(answer) for answer in answers]
+    return tasks
+
+
+def main(
+    cache_mode: str = "readwrite",
+    cache_size: int = CACHE_SIZE,
+    restart: bool = False,
+    mock_latency: float = None,
+    engine: str = "llama2",
+):
+    hints_path = HINTS_PATH
+    checkpoint = checkpoint_path("ramai_game_hints")
+    cache_path = CACHE_PATH
+    params = GENERATION_PARAMS
+    batch_size = MAX_BATCH_SIZE
+    if engine == "vllm":
+        REGISTRY.factories[MODEL_NAME] = load_llama2_vllm
+        params = VLLM_PARAMS
+        batch_size = VLLM_BATCH_SIZE
+    if mock_latency is not None:
+        # Deterministic offline responses, kept apart from the real ones; the
+        # mock stands in for either engine
+        REGISTRY.factories[MODEL_NAME] = partial(
+            MockBackend, MODEL_NAME, prompt_latency=mock_latency
+        )
+        params = GENERATION_PARAMS
+        hints_path = os.path.join(MOCK_DIR, os.path.basename(hints_path))
+        checkpoint = os.path.join(MOCK_DIR, os.path.basename(checkpoint))
+        cache_path = os.path.join(MOCK_DIR, "responses.db")
+    cache = ResponseCache(cache_path, cache_mode, cache_size)
 
-        questions.loc[ix, f"hint_A"] = hints[0]
-        questions.loc[ix, f"hint_B"] = hints[1]
-        questions.loc[ix, f"hint_C"] = hints[2]
-        questions.loc[ix, f"hint_D"] = hints[3]
+    # Load templates
+    template = {}
+    with open(
+        os.path.join(RAMAI_GAME_DIR, "template_manipulative.txt"), "r", encoding="utf8"
+    ) as f:
+        template["manipulative"] = f.read()
+    with open(
+        os.path.join(RAMAI_GAME_DIR, "template_truthful.txt"), "r", encoding="utf8"
+    ) as f:
+        template["truthful"] = f.read()
 
-        # Save hints
-        questions.to_csv(os.path.join(RAMAI_GAME_DIR, f"ramai_game_hints.csv"))
+    # Prompts of the whole question bank, skipping the hints completed in the
+    # checkpoint
+    questions = pd.read_csv(MILLIONAIR_QUESTIONS_PATH, index_col=0)
+    sink = ResultSink(checkpoint, ["question_id", "letter"], resume=not restart)
+    tasks = get_tasks(questions, template, sink)
+
+    # Generate hints in full batches spanning the questions, every distinct
+    # prompt once, and checkpoint them by key as the batches complete. The
+    # batches never mix templates, so the prompts of a batch share their prefix
+    with sink:
+        for prompts in tasks.values():
+            keys = list(prompts)
+            answers = cache.iter_generate(
+                MODEL_NAME,
+                list(prompts.values()),
+                params,
+                lambda prompts: REGISTRY.get(MODEL_NAME).generate_batch(
+                    prompts, params
+                ),
+                batch_size,
+            )
+            for i, answer in answers:
+                ix, letter = keys[i]
+                sink.append(
+                    {
+                        "question_id": ix,
+                        "letter": letter,
+                        "hint": extract_answer(answer),
+                    }
+                )
+
+    # Save hints
+    for letter in LETTERS:
+        questions[f"hint_{letter}"] = [
+            sink.get((ix, letter))["hint"] for ix in questions.index
+        ]
+    questions.to_csv(hints_path)
+    sink.finish()
+    REGISTRY.unload_all()
+    print(cache)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_cache_arguments(parser)
+    add_checkpoint_arguments(parser)
+    parser.add_argument(
+        "--mock",
+        nargs="?",
+        type=float,
+        const=0.0,
+        metavar="LATENCY",
+        help="generate deterministic offline hints with the given latency in "
+        "seconds per prompt, writing the results to data/cache/mock",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="llama2",
+        help="generate with the LLaMA 2 reference implementation, or with vLLM "
+        "reusing the key/value cache of the template prefixes (default: llama2)",
+    )
+    args = parser.parse_args()
+    main(args.cache, args.cache_size, args.restart, args.mock, args.engine)
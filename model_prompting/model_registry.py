@@ -0,0 +1,101 @@
+"""
+Registry of the models used by the prompting scripts, created on first use.
+"""
+
+import gc
+import threading
+from contextlib import contextmanager
+
+
+class ModelRegistry:
+    """
+    Class to create models on first use and unload them on request
+
+    Models in `exclusive` (e.g. the tensor-parallel vLLM engines) are never
+    resident at the same time: using one unloads the others, and they are used
+    one at a time. Loading a model does not block the models already loaded,
+    nor the loading of the other (non-exclusive) models.
+
+    Attributes:
+    factories (dict): Functions creating every model, by model name
+    exclusive (set): Names of the models which are not loaded together
+    models (dict): Loaded models, by model name
+    """
+
+    def __init__(self, factories: dict, exclusive: set = ()):
+        self.factories = factories
+        self.exclusive = set(exclusive)
+        self.models = {}
+        self._lock = threading.RLock()
+        self._exclusive_lock = threading.RLock()
+        self._load_locks = {}
+
+    def __repr__(self):
+        return f"ModelRegistry: {list(self.models)} loaded of {list(self.factories)}"
+
+    def get(self, name: str):
+        """Return the model, creating it (and unloading exclusive ones) first."""
+        if name not in self.factories:
+            raise KeyError(
+                f"Unknown model '{name}', expected one of {list(self.factories)}"
+            )
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        with self._load_lock(name):
+            if name not in self.models:
+                if name in self.exclusive:
+                    for other in list(self.models):
+                        if other in self.exclusive:
+                            self.unload(other)
+                print(f"Loading {name}")
+                model = self.factories[name]()
+                with self._lock:
+                    self.models[name] = model
+            return self.models[name]
+
+    def _load_lock(self, name: str) -> threading.RLock:
+        # the exclusive models share one lock, so only one of them is loaded
+        if name in self.exclusive:
+            return self._exclusive_lock
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.RLock())
+
+    @contextmanager
+    def use(self, name: str):
+        """Yield the model, keeping the other exclusive models unloaded meanwhile."""
+        if name not in self.exclusive:
+            yield self.get(name)
+            return
+        with self._exclusive_lock:
+            yield self.get(name)
+
+    def unload(self, name: str):
+        with self._lock:
+            if self.models.pop(name, None) is None:
+                return
+            print(f"Unloading {name}")
+            gc.collect()
+            free_gpu_memory()
+
+    def unload_all(self):
+        for name in list(self.models):
+            self.unload(name)
+
+
+def free_gpu_memory():
+    # vLLM keeps its distributed state and torch its cached blocks after the
+    # engine is deleted
+    try:
+        from vllm.distributed.parallel_state import destroy_model_parallel
+
+        destroy_model_parallel()
+    except ImportError:
+        pass
+    try:
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
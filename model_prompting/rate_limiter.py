@@ -0,0 +1,197 @@
+"""
+Rate limiting of the requests to the remote models.
+
+Every remote model has a token bucket of requests and one of tokens per minute,
+refilled continuously up to `burst` seconds of quota. A request waits until both
+buckets hold enough, so the requests stay at the quota instead of running into
+it. Throttling and transient errors are retried with jittered exponential
+backoff, or after the delay of the retry-after header when the provider sends
+one. A throttled request also pauses the other requests of the model and halves
+its rate, which is recovered gradually as requests succeed.
+"""
+
+import time
+import random
+import threading
+
+# HTTP status codes of throttling and transient server errors
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+THROTTLING_ERRORS = {"RateLimitError", "ResourceExhausted", "TooManyRequests"}
+RETRY_ERRORS = THROTTLING_ERRORS | {
+    "APIConnectionError",
+    "APITimeoutError",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "ServiceUnavailable",
+}
+# Lowest fraction of the quota a throttled limiter slows down to
+MIN_SCALE = 0.1
+
+
+def get_status(error: Exception) -> int:
+    # openai errors have a status_code, google.api_core errors an HTTP code
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttling(error: Exception) -> bool:
+    return get_status(error) == 429 or type(error).__name__ in THROTTLING_ERRORS
+
+
+def is_retryable(error: Exception) -> bool:
+    return (
+        get_status(error) in RETRY_STATUS
+        or type(error).__name__ in RETRY_ERRORS
+        or isinstance(error, (TimeoutError, ConnectionError))
+    )
+
+
+def get_retry_after(error: Exception) -> float:
+    """Return the delay requested by the retry-after headers of the error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, unit in [("retry-after-ms", 1e-3), ("retry-after", 1.0)]:
+        try:
+            return float(headers[header]) * unit
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+class TokenBucket:
+    """
+    Class to store a bucket refilled at a constant rate
+
+    Attributes:
+    rate (float): Refill per second
+    capacity (float): Size of the bucket
+    level (float): Current content
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = now
+
+    def __repr__(self):
+        return f"TokenBucket: {self.level:.1f}/{self.capacity:.1f}"
+
+    def refill(self, now: float, scale: float = 1.0):
+        self.level = min(
+            self.capacity, self.level + (now - self.updated) * self.rate * scale
+        )
+        self.updated = now
+
+    def wait(self, amount: float, scale: float = 1.0) -> float:
+        """Return the seconds until the bucket holds `amount`."""
+        return max(0.0, min(amount, self.capacity) - self.level) / (self.rate * scale)
+
+    def take(self, amount: float):
+        # a request larger than the bucket leaves it in debt, so the rate holds
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Class to keep the requests to a model under its requests and tokens per
+    minute, retrying throttled and failed requests
+
+    Attributes:
+    rpm (float): Requests per minute
+    tpm (float): Tokens per minute, or None when only requests are limited
+    burst (float): Seconds of quota which can be used at once
+    max_retries (int): Retries of a request before its error is raised
+    base_delay (float): Backoff of the first retry, in seconds
+    max_delay (float): Longest backoff, in seconds
+    scale (float): Fraction of the quota currently used, lowered on throttling
+    """
+
+    def __init__(
+        self,
+        rpm: float,
+        tpm: float = None,
+        burst: float = 10.0,
+        max_retries: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.scale = 1.0
+        self.clock = clock
+        self.sleep = sleep
+        now = clock()
+        self._requests = TokenBucket(rpm / 60, max(1.0, rpm * burst / 60), now)
+        self._tokens = None
+        if tpm is not None:
+            self._tokens = TokenBucket(tpm / 60, max(1.0, tpm * burst / 60), now)
+        self._paused_until = now
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RateLimiter: {self.rpm} rpm, {self.tpm} tpm, scale {self.scale:.2f}"
+
+    def acquire(self, tokens: int = 0):
+        """Wait until a request of `tokens` tokens fits in the quota, and take it."""
+        while True:
+            with self._lock:
+                now = self.clock()
+                buckets = [(self._requests, 1)]
+                if self._tokens is not None:
+                    buckets.append((self._tokens, tokens))
+                for bucket, _ in buckets:
+                    bucket.refill(now, self.scale)
+                wait = max(
+                    [self._paused_until - now]
+                    + [bucket.wait(amount, self.scale) for bucket, amount in buckets]
+                )
+                if wait <= 0:
+                    for bucket, amount in buckets:
+                        bucket.take(amount)
+                    return
+            self.sleep(wait)
+
+    def throttled(self, delay: float):
+        """Pause all requests for `delay` seconds and halve the rate."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + delay)
+            self.scale = max(MIN_SCALE, self.scale / 2)
+
+    def succeeded(self):
+        with self._lock:
+            self.scale = min(1.0, self.scale + 0.05)
+
+    def get_backoff(self, attempt: int) -> float:
+        # full jitter: uniform up to the exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def call(self, request, tokens: int = 0):
+        """Send `request()` within the quota, retrying throttling and transient errors."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            try:
+                response = request()
+            except Exception as error:
+                if attempt == self.max_retries or not is_retryable(error):
+                    raise
+                delay = get_retry_after(error)
+                if delay is None:
+                    delay = self.get_backoff(attempt)
+                print(
+                    f"{type(error).__name__}, retrying in {delay:.1f} s "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+                if is_throttling(error):
+                    self.throttled(delay)
+                else:
+                    self.sleep(delay)
+            else:
+                self.succeeded()
+                return response
@@ -0,0 +1,239 @@
+"""
+Persistent cache of the model responses, shared by the prompting scripts.
+
+Responses are stored in SQLite, addressed by a hash of the model name, the full
+prompt and the generation parameters. The cache is read through: cached prompts
+are never sent to the models again, and the least recently used responses are
+evicted once the cache outgrows its size limit.
+
+Modes:
+- readwrite: read cached responses and store new ones (default)
+- readonly: read cached responses, never write
+- refresh: regenerate all responses and overwrite the cached ones
+- off: bypass the cache
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_PATH = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "data",
+        "cache",
+        "responses.db",
+    )
+)
+MODES = ["readwrite", "readonly", "refresh", "off"]
+# Size limit of the cached responses, in MB
+CACHE_SIZE = 1024
+
+
+class ResponseCache:
+    """
+    Class to read model responses through a persistent SQLite cache
+
+    The database is opened on first use and shared by the threads of the
+    process; concurrent processes are serialized by SQLite.
+
+    Attributes:
+    path (str): Path of the database
+    mode (str): One of MODES
+    max_size (int): Size limit of the cached responses, in bytes
+    hits (int): Number of responses read from the cache
+    misses (int): Number of responses generated
+    """
+
+    def __init__(
+        self, path: str = CACHE_PATH, mode: str = "readwrite", size: int = CACHE_SIZE
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_size = size * 2**20
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._size = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"ResponseCache: {self.path} ({self.mode}), "
+            f"{self.hits} hits, {self.misses} misses"
+        )
+
+    @staticmethod
+    def key(model: str, prompt: str, params: dict = None) -> str:
+        # parameters are serialized with sorted keys, so their order is irrelevant
+        content = json.dumps(
+            [model, prompt, params or {}], sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(content.encode("utf8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=60, check_same_thread=False, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, "
+                "size INTEGER, accessed REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+            self._size = connection.execute(
+                "SELECT TOTAL(size) FROM responses"
+            ).fetchone()[0]
+            self._connection = connection
+        return self._connection
+
+    def get_many(self, keys: list) -> dict:
+        """Return the cached responses of the keys, by key."""
+        if self.mode in ["refresh", "off"] or not keys:
+            return {}
+        with self._lock:
+            connection = self._connect()
+            found = {}
+            unique = list(dict.fromkeys(keys))
+            # SQLite limits the number of parameters of a statement
+            for i in range(0, len(unique), 500):
+                chunk = unique[i : i + 500]
+                rows = connection.execute(
+                    "SELECT key, response FROM responses WHERE key IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update((key, json.loads(response)) for key, response in rows)
+            if found and self.mode == "readwrite":
+                connection.executemany(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    [(time.time(), key) for key in found],
+                )
+        return found
+
+    def put_many(self, model: str, responses: dict):
+        """Store the responses of the model, by key."""
+        if self.mode in ["readonly", "off"] or not responses:
+            return
+        rows = []
+        for key, response in responses.items():
+            response = json.dumps(response, ensure_ascii=False)
+            rows.append((key, model, response, len(response.encode("utf8"))))
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    [row + (time.time(),) for row in rows],
+                )
+                self._size += sum(row[3] for row in rows)
+                if self._size > self.max_size:
+                    self._evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _evict(self, connection: sqlite3.Connection):
+        # the running size is only an upper bound when other processes write,
+        # so the exact size is computed before evicting
+        size = connection.execute("SELECT TOTAL(size) FROM responses").fetchone()[0]
+        if size > self.max_size:
+            rows = connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            ).fetchall()
+            evicted = []
+            for key, row_size in rows:
+                if size <= self.max_size:
+                    break
+                evicted.append((key,))
+                size -= row_size
+            connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            print(f"Evicted {len(evicted)} responses from the cache")
+        self._size = size
+
+    def iter_generate(
+        self,
+        model: str,
+        prompts: list,
+        params: dict,
+        generate_batch,
+        batch_size: int = None,
+    ):
+        """
+        Yield the index and response of every prompt, the cached ones first,
+        calling `generate_batch(prompts)` on at most `batch_size` distinct
+        prompts not cached at a time. The responses of every batch are stored
+        before they are yielded.
+        """
+        keys = [self.key(model, prompt, params) for prompt in prompts]
+        responses = self.get_many(keys)
+        missing = {}
+        for i, key in enumerate(keys):
+            if key in responses:
+                self.hits += 1
+                yield i, responses[key]
+            else:
+                missing.setdefault(key, []).append(i)
+        missing_keys = list(missing)
+        batch_size = batch_size or max(1, len(missing_keys))
+        for start in range(0, len(missing_keys), batch_size):
+            batch = missing_keys[start : start + batch_size]
+            generated = generate_batch([prompts[missing[key][0]] for key in batch])
+            new = dict(zip(batch, generated))
+            self.misses += len(new)
+            self.put_many(model, new)
+            for key, response in new.items():
+                for i in missing[key]:
+                    yield i, response
+
+    def get_or_generate_batch(
+        self, model: str, prompts: list, params: dict, generate_batch
+    ) -> list:
+        """
+        Return the responses of the model to the prompts, calling
+        `generate_batch(prompts)` only for the distinct prompts not cached.
+        """
+        responses = [None] * len(prompts)
+        for i, response in self.iter_generate(model, prompts, params, generate_batch):
+            responses[i] = response
+        return responses
+
+    def get_or_generate(self, model: str, prompt: str, params: dict, generate):
+        """Return the response of the model, calling `generate(prompt)` if not cached."""
+        return self.get_or_generate_batch(
+            model, [prompt], params, lambda prompts: [generate(prompts[0])]
+        )[0]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def add_cache_arguments(parser):
+    parser.add_argument(
+        "--cache",
+        choices=MODES,
+        default="readwrite",
+        help="mode of the response cache (default: readwrite)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE,
+        help=f"size limit of the response cache in MB (default: {CACHE_SIZE})",
+    )
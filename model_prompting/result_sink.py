@@ -0,0 +1,145 @@
+"""
+Append-only checkpoints of the prompting results.
+
+Every completed task is appended to a JSONL checkpoint as one record, so the
+results are written once instead of rewriting the whole output after every
+task. Appends are flushed immediately and fsynced in batches. When a run is
+interrupted, the next run reads the checkpoint and skips the finished tasks;
+once the output is written, the checkpoint is removed.
+"""
+
+import os
+import json
+import time
+
+CHECKPOINT_DIR = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache", "checkpoints"
+    )
+)
+# fsync after this many records or seconds, whichever comes first
+SYNC_EVERY = 100
+SYNC_INTERVAL = 5.0
+
+
+def checkpoint_path(name: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, f"{name}.jsonl")
+
+
+def _to_json(value):
+    # numpy scalars, e.g. ids read with pandas
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResultSink:
+    """
+    Class to append completed results to a JSONL checkpoint and resume from it
+
+    Attributes:
+    path (str): Path of the checkpoint
+    key (list): Fields identifying a task in the records
+    records (dict): Completed records, by task key
+    sync_every (int): Number of records between fsyncs
+    sync_interval (float): Seconds between fsyncs
+    """
+
+    def __init__(
+        self,
+        path: str,
+        key: list,
+        resume: bool = True,
+        sync_every: int = SYNC_EVERY,
+        sync_interval: float = SYNC_INTERVAL,
+    ):
+        self.path = path
+        self.key = key
+        self.records = {}
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._pending = 0
+        self._synced = time.monotonic()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf8")
+        if self.records:
+            print(f"Resuming from {path}: {len(self.records)} tasks done")
+
+    def __repr__(self):
+        return f"ResultSink: {self.path}, {len(self.records)} records"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        valid = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a record torn by a crash, the later records are dropped
+                break
+            if not line.endswith(b"\n"):
+                break
+            self.records[self.get_key(record)] = record
+            valid += len(line)
+        if valid < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+
+    def get_key(self, record: dict) -> tuple:
+        return tuple(record[field] for field in self.key)
+
+    def get(self, key: tuple) -> dict:
+        return self.records.get(key)
+
+    def append(self, record: dict):
+        """Append a completed record, fsyncing every `sync_every` records."""
+        self._file.write(json.dumps(record, default=_to_json, ensure_ascii=False))
+        self._file.write("\n")
+        self._file.flush()
+        self.records[self.get_key(record)] = record
+        self._pending += 1
+        if (
+            self._pending >= self.sync_every
+            or time.monotonic() - self._synced >= self.sync_interval
+        ):
+            self.sync()
+
+    def sync(self):
+        if self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._synced = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def finish(self):
+        """Close and remove the checkpoint, once the results are written."""
+        self.close()
+        os.remove(self.path)
+
+
+def add_checkpoint_arguments(parser):
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="discard the checkpoint of an interrupted run instead of resuming it",
+    )
@@ -0,0 +1,9 @@
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the scripts import their sibling modules by name, the classifiers by package
+for directory in ["data_manipulation", "model_prompting"]:
+    sys.path.insert(0, os.path.join(REPO_DIR, directory))
+sys.path.append(REPO_DIR)
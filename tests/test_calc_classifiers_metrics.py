@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from calc_classifiers_metrics import load_predictions, model_names, TEMPLATES
+
+
+class FakeStore:
+    def __init__(self, respondents: list):
+        self.respondents = respondents
+
+    def ramai_llm(self, type: str) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "model": self.respondents,
+                "manipulative": np.arange(len(self.respondents)) % 2,
+            },
+            index=np.arange(len(self.respondents)) + 10,
+        )
+
+    def classifier(self, name: str, type: str) -> pd.DataFrame:
+        return pd.DataFrame(
+            1, index=np.arange(len(self.respondents)) + 10, columns=TEMPLATES
+        )
+
+
+def test_load_predictions():
+    respondents = ["GPT-4", "Dolphin", "GPT-4"]
+    labels, respondent_codes, predictions = load_predictions(FakeStore(respondents))
+    assert labels.tolist() == [0, 1, 0, 0, 0, 0]
+    assert respondent_codes.tolist() == [3, 1, 3] * 2
+    assert predictions.shape == (len(model_names), len(TEMPLATES), 6)
+
+
+def test_unknown_respondents_are_rejected():
+    with pytest.raises(ValueError, match="gpt-5"):
+        load_predictions(FakeStore(["GPT-4", "gpt-5", None]))
@@ -0,0 +1,24 @@
+import pandas as pd
+from data_store import DataStore
+
+
+def test_selected_columns_match_a_full_read(tmp_path):
+    store = DataStore(str(tmp_path))
+    table = pd.DataFrame(
+        {
+            "game_id": [3, 1, 2],
+            "answer": ["A", None, "C"],
+            "time_full": [1.5, 2.0, None],
+            "question_id": [10, 11, 12],
+        },
+        index=[7, 8, 9],
+    )
+    store.write(table, "raw-csv", "answers", "test")
+    full = store.read("raw-csv", "answers", "test", index_col=0)
+    for columns in [["time_full", "game_id"], ["answer"]]:
+        selected = store.read("raw-csv", "answers", "test", columns, index_col=0)
+        pd.testing.assert_frame_equal(selected, full.loc[:, columns])
+    selected = store.read("raw-csv", "answers", "test", ["answer"])
+    pd.testing.assert_frame_equal(
+        selected, full.reset_index(drop=True).loc[:, ["answer"]]
+    )
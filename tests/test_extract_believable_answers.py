@@ -0,0 +1,60 @@
+import sqlite3
+import pandas as pd
+import extract_raw_data
+import extract_believable_answers
+from datetime import datetime
+from data_store import DataStore
+from events import Event
+from test_extract_raw_data import create_database
+
+EVENTS = [
+    Event("MLinPL", datetime(2023, 6, 1), datetime(2023, 6, 2)),
+    Event("MPD", datetime(2023, 7, 1), datetime(2023, 7, 2)),
+    Event("Third", datetime(2023, 8, 1), datetime(2023, 8, 2)),
+]
+
+
+def normalize(believable_answers: pd.DataFrame) -> pd.DataFrame:
+    believable_answers = believable_answers.astype(
+        {"question_id": int, "answer_LLM": str, "answer_correct": str}
+    )
+    return believable_answers.sort_values(["question_id", "answer_LLM"]).reset_index(
+        drop=True
+    )
+
+
+def test_pandas_and_sql_modes_match(tmp_path, monkeypatch):
+    for module in [extract_raw_data, extract_believable_answers]:
+        monkeypatch.setattr(module, "DATABASE_DIR", str(tmp_path))
+    monkeypatch.setattr(extract_raw_data, "OUTPUT_CSV_DIR", str(tmp_path / "raw-csv"))
+    store = DataStore(str(tmp_path))
+    for seed, event in enumerate(EVENTS):
+        create_database(
+            tmp_path / event.database,
+            games=40,
+            questions=30,
+            seed=seed,
+            start=event.start_date.strftime("%Y-%m-%d"),
+        )
+        # answers without a hint store an empty hint_ans, even when decepted
+        cnx = sqlite3.connect(tmp_path / event.database)
+        cnx.execute("""UPDATE main_answer SET hint_ans = '', answer = '',
+            answer_before_prompt = (
+                SELECT correct_ans FROM main_question q WHERE q.id = question_id
+            )
+            WHERE id % 5 = 0""")
+        cnx.commit()
+        cnx.close()
+        extract_raw_data.extract_event(event, False, store)
+
+    for threshold in [0, 1, 2]:
+        believable_answers = extract_believable_answers.get_believable_answers(
+            store, EVENTS, threshold
+        )
+        believable_answers_sql = extract_believable_answers.get_believable_answers_sql(
+            EVENTS, threshold
+        )
+        assert len(believable_answers_sql)
+        pd.testing.assert_frame_equal(
+            normalize(believable_answers), normalize(believable_answers_sql)
+        )
@@ -0,0 +1,228 @@
+import json
+import sqlite3
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import extract_raw_data
+from data_store import DataStore
+from events import Event, DATE_FORMAT
+from extract_raw_data import get_question_count
+
+
+def get_question_count_loop(answers: pd.DataFrame) -> pd.Series:
+    # the per-row loop replaced by get_question_count
+    answers = answers.copy()
+    answers["question_count"] = None
+    for ix, row in answers.iterrows():
+        answers_before = len(
+            answers.loc[
+                (answers["game_id"] == row["game_id"])
+                & (answers["timestamp"] < row["timestamp"]),
+                :,
+            ]
+        )
+        answers.loc[ix, "question_count"] = answers_before
+    return answers["question_count"].astype(int)
+
+
+def get_answers(seed: int, size: int = 300) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # few distinct timestamps per game, so that ties are frequent
+    timestamps = pd.Timestamp("2023-01-01") + pd.to_timedelta(
+        rng.integers(0, 20, size), unit="s"
+    )
+    timestamps = pd.Series(timestamps).where(rng.random(size) > 0.1)
+    return pd.DataFrame(
+        {"game_id": rng.integers(0, 15, size), "timestamp": timestamps.values},
+        index=rng.permutation(size) + 100,
+    )
+
+
+def test_question_count_matches_loop():
+    for seed in range(5):
+        answers = get_answers(seed)
+        assert answers["timestamp"].isna().any()
+        pd.testing.assert_series_equal(
+            get_question_count(answers),
+            get_question_count_loop(answers),
+            check_names=False,
+        )
+
+
+def test_question_count_ties_and_missing():
+    answers = pd.DataFrame(
+        {
+            "game_id": [1, 1, 1, 1, 2, 2],
+            "timestamp": pd.to_datetime(
+                [
+                    "2023-01-01 10:00:02",
+                    "2023-01-01 10:00:01",
+                    "2023-01-01 10:00:02",
+                    None,
+                    "2023-01-01 10:00:00",
+                    "2023-01-01 10:00:05",
+                ]
+            ),
+        }
+    )
+    assert get_question_count(answers).tolist() == [1, 0, 1, 0, 0, 1]
+
+
+def create_database(
+    path, games: int, questions: int = 5, seed: int = 0, start: str = "2023-06-01"
+):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start) + pd.Timedelta(hours=10)
+    rows = []
+    for game_id in range(1, games + 1):
+        timestamp = start + pd.Timedelta(minutes=game_id)
+        rows.append(
+            {
+                "id": game_id,
+                "username": "",
+                "email": "",
+                "is_mobile": 0,
+                "is_tablet": 0,
+                "is_touch_capable": 0,
+                "is_pc": 1,
+                "is_bot": 0,
+                "browser_family": "",
+                "browser_version": "",
+                "os_family": "",
+                "os_version": "",
+                "device_family": "",
+                "code": "",
+                "sex": "m",
+                "age": 1,
+                "education": 2,
+                "game_won": int(game_id % 2),
+                "timestamp_start": timestamp.strftime(DATE_FORMAT),
+                "timestamp_2": (timestamp + pd.Timedelta(seconds=20)).strftime(
+                    DATE_FORMAT
+                ),
+                "timestamp_7": (timestamp + pd.Timedelta(seconds=70)).strftime(
+                    DATE_FORMAT
+                ),
+                "timestamp_end": (timestamp + pd.Timedelta(seconds=90)).strftime(
+                    DATE_FORMAT
+                ),
+            }
+        )
+    answers = []
+    for game in rows:
+        for number in range(3):
+            answers.append(
+                {
+                    "id": len(answers) + 1,
+                    "question_number": number,
+                    "answer": "ABCD"[rng.integers(4)],
+                    "correct": int(rng.integers(2)),
+                    "hint_asked": 1,
+                    "hint_imposed": 0,
+                    "hint_ans": "ABCD"[rng.integers(4)],
+                    "hint_correct": int(rng.integers(2)),
+                    "answer_before_prompt": "ABCD"[rng.integers(4)],
+                    "time_full": 10.0,
+                    "time_after_hint": 5.0,
+                    "question_id": int(rng.integers(1, questions + 1)),
+                    "game_id": game["id"],
+                    "timestamp": (
+                        pd.Timestamp(game["timestamp_start"])
+                        + pd.Timedelta(seconds=10 * number)
+                    ).strftime(DATE_FORMAT),
+                }
+            )
+    question_rows = [
+        {
+            "id": i,
+            "content": f"question {i}",
+            "correct_ans": "ABCD"[i % 4],
+            **{f"ans_{letter}": f"answer {i}{letter}" for letter in "ABCD"},
+            **{f"hint_{letter}": f"hint {i}{letter}" for letter in "ABCD"},
+        }
+        for i in range(1, questions + 1)
+    ]
+    with sqlite3.connect(path) as cnx:
+        pd.DataFrame(rows).to_sql("main_game", cnx, index=False, if_exists="replace")
+        pd.DataFrame(answers).to_sql(
+            "main_answer", cnx, index=False, if_exists="replace"
+        )
+        pd.DataFrame(question_rows).to_sql(
+            "main_question", cnx, index=False, if_exists="replace"
+        )
+
+
+def read_outputs(store: DataStore) -> dict:
+    tables = {}
+    for name, key in [("games", "id"), ("answers", "id"), ("questions", "id")]:
+        table = store.read("raw-csv", name, "test", index_col=0)
+        tables[name] = table.sort_values(key).reset_index(drop=True)
+    return tables
+
+
+def test_failed_incremental_run_keeps_watermark(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_raw_data, "DATABASE_DIR", str(tmp_path))
+    monkeypatch.setattr(extract_raw_data, "OUTPUT_CSV_DIR", str(tmp_path / "raw-csv"))
+    event = Event("Test", datetime(2023, 6, 1), datetime(2023, 6, 2), "test.sqlite3")
+    store = DataStore(str(tmp_path))
+    watermark_path = tmp_path / "raw-csv" / "test_watermark.json"
+
+    create_database(tmp_path / "test.sqlite3", games=6)
+    extract_raw_data.extract_event(event, False, store)
+    watermark = watermark_path.read_text()
+
+    # new games answering a question missing from the question table
+    create_database(tmp_path / "test.sqlite3", games=10, questions=5)
+    with sqlite3.connect(tmp_path / "test.sqlite3") as cnx:
+        cnx.execute("DELETE FROM main_question WHERE id = 5")
+        assert cnx.execute(
+            "SELECT COUNT(*) FROM main_answer WHERE question_id = 5 AND game_id > 6"
+        ).fetchone()[0]
+    with pytest.raises(KeyError):
+        extract_raw_data.extract_event(event, True, store)
+    assert watermark_path.read_text() == watermark
+
+    # the next run extracts the new games, as a full extraction would
+    create_database(tmp_path / "test.sqlite3", games=10, questions=5)
+    extract_raw_data.extract_event(event, True, store)
+    incremental = read_outputs(store)
+    extract_raw_data.extract_event(event, False, store)
+    full = read_outputs(store)
+    for name in full:
+        pd.testing.assert_frame_equal(incremental[name], full[name])
+    assert json.loads(watermark_path.read_text())["game_id"] == 10
+
+
+def test_abandoned_games_leave_the_watermark(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_raw_data, "OUTPUT_CSV_DIR", str(tmp_path))
+    event = Event("Test", datetime(2023, 6, 1), datetime(2023, 6, 2))
+    games = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 4, 5],
+            "timestamp_start": pd.to_datetime(
+                [
+                    "2023-06-01 10:00:00",
+                    "2023-06-01 23:00:00",
+                    "2023-06-01 23:30:00",
+                    "2023-06-02 10:00:00",
+                    None,
+                ]
+            ),
+            "timestamp_end": pd.to_datetime(
+                ["2023-06-01 10:05:00", None, None, None, None]
+            ),
+        }
+    )
+
+    def open_games(now: datetime) -> list:
+        extract_raw_data.save_watermark(event, games, None, now)
+        with open(tmp_path / "test_watermark.json", encoding="utf8") as f:
+            return json.load(f)["open_games"]
+
+    # unfinished games of the event, and games not started yet
+    assert open_games(datetime(2023, 6, 2, 12)) == [2, 3, 5]
+    # game 2 was started more than GAME_TIMEOUT ago
+    assert open_games(datetime(2023, 6, 2, 23, 15)) == [3, 5]
+    # long after the event, no game can still be finished
+    assert open_games(datetime(2023, 7, 1)) == []
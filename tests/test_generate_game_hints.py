@@ -0,0 +1,187 @@
+import sys
+import types
+import zlib
+import pandas as pd
+import pytest
+import generate_game_hints
+import result_sink
+from backends import MockBackend
+from model_registry import ModelRegistry
+
+
+class RecordingBackend(MockBackend):
+    # the prompts of every generated batch, shared by the instances
+    batches = []
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        self.batches.append(list(prompts))
+        return super().generate_batch(prompts, params)
+
+
+def get_questions(size: int = 11) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "content": [f"Which answer is right in question {i}?" for i in range(size)],
+            **{
+                f"ans_{letter}": [f"answer {letter}{i}" for i in range(size)]
+                for letter in generate_game_hints.LETTERS
+            },
+            "correct_ans": ["ABCD"[i % 4] for i in range(size)],
+        },
+        index=pd.Index(range(100, 100 + size), name="id"),
+    )
+
+
+def run(engine: str, tmp_path, monkeypatch) -> tuple:
+    questions_path = tmp_path / "questions.csv"
+    get_questions().to_csv(questions_path)
+    monkeypatch.setattr(
+        generate_game_hints, "MILLIONAIR_QUESTIONS_PATH", str(questions_path)
+    )
+    monkeypatch.setattr(generate_game_hints, "MOCK_DIR", str(tmp_path / engine))
+    monkeypatch.setattr(generate_game_hints, "MockBackend", RecordingBackend)
+    monkeypatch.setattr(
+        generate_game_hints,
+        "REGISTRY",
+        ModelRegistry({generate_game_hints.MODEL_NAME: None}),
+    )
+    monkeypatch.setattr(RecordingBackend, "batches", [])
+    generate_game_hints.main(cache_mode="off", mock_latency=0, engine=engine)
+    hints = pd.read_csv(tmp_path / engine / "ramai_game_hints.csv", index_col=0)
+    return hints, RecordingBackend.batches
+
+
+def get_prefix(prompt: str) -> str:
+    return prompt[: prompt.rindex("#" * 30)]
+
+
+@pytest.mark.parametrize("engine", generate_game_hints.ENGINES)
+def test_batches_share_the_template_prefix(engine, tmp_path, monkeypatch):
+    _, batches = run(engine, tmp_path, monkeypatch)
+    prompts = [prompt for batch in batches for prompt in batch]
+    assert len(prompts) == len(set(prompts)) == 4 * len(get_questions())
+    assert all(len({get_prefix(prompt) for prompt in batch}) == 1 for batch in batches)
+
+
+def test_engines_generate_the_same_hints(tmp_path, monkeypatch):
+    hints, batches = run("llama2", tmp_path, monkeypatch)
+    vllm_hints, vllm_batches = run("vllm", tmp_path, monkeypatch)
+    pd.testing.assert_frame_equal(hints, vllm_hints)
+    assert all(len(batch) <= generate_game_hints.MAX_BATCH_SIZE for batch in batches)
+    assert len(vllm_batches) < len(batches)
+
+
+def complete(prompt: str) -> str:
+    # a deterministic hint, ended like the few-shot examples
+    return f" hint {zlib.crc32(prompt.encode('utf8'))}.\n" + "#" * 30
+
+
+class FakeLLaMA2:
+    # the build arguments, prompts and parameters of every call
+    calls = []
+
+    @classmethod
+    def build(cls, **kwargs) -> "FakeLLaMA2":
+        cls.calls.append(("build", kwargs))
+        return cls()
+
+    def text_completion(self, prompts: list, **params) -> list:
+        self.calls.append((list(prompts), params))
+        return [
+            {"generation": (prompt if params["echo"] else "") + complete(prompt)}
+            for prompt in prompts
+        ]
+
+
+class FakeTokenizer:
+    @classmethod
+    def from_pretrained(cls, path: str) -> "FakeTokenizer":
+        return cls()
+
+    def encode(self, prompt: str) -> list:
+        return [ord(character) for character in prompt]
+
+
+class FakeSamplingParams:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+class FakeLLM:
+    # the engine arguments, prompts and sampling parameters of every call
+    calls = []
+
+    def __init__(self, **kwargs):
+        self.calls.append(("build", kwargs))
+
+    def generate(self, prompt_token_ids: list, sampling_params) -> list:
+        prompts = ["".join(map(chr, token_ids)) for token_ids in prompt_token_ids]
+        self.calls.append((prompts, sampling_params.kwargs))
+        return [
+            types.SimpleNamespace(outputs=[types.SimpleNamespace(text=complete(p))])
+            for p in prompts
+        ]
+
+
+def run_engine(engine: str, tmp_path, monkeypatch, cache_mode: str = "off"):
+    questions_path = tmp_path / "questions.csv"
+    get_questions().to_csv(questions_path)
+    monkeypatch.setattr(
+        generate_game_hints, "MILLIONAIR_QUESTIONS_PATH", str(questions_path)
+    )
+    monkeypatch.setattr(generate_game_hints, "HINTS_PATH", str(tmp_path / "hints.csv"))
+    monkeypatch.setattr(generate_game_hints, "CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(result_sink, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(
+        generate_game_hints,
+        "REGISTRY",
+        ModelRegistry(
+            {generate_game_hints.MODEL_NAME: generate_game_hints.load_llama2}
+        ),
+    )
+    monkeypatch.setitem(sys.modules, "llama2", types.SimpleNamespace(LLaMA2=FakeLLaMA2))
+    monkeypatch.setitem(
+        sys.modules,
+        "vllm",
+        types.SimpleNamespace(LLM=FakeLLM, SamplingParams=FakeSamplingParams),
+    )
+    monkeypatch.setitem(
+        sys.modules, "transformers", types.SimpleNamespace(AutoTokenizer=FakeTokenizer)
+    )
+    monkeypatch.setattr(FakeLLaMA2, "calls", [])
+    monkeypatch.setattr(FakeLLM, "calls", [])
+    generate_game_hints.main(cache_mode=cache_mode, engine=engine)
+    hints = pd.read_csv(tmp_path / "hints.csv", index_col=0)
+    # the build arguments of the model, if loaded, and the generation calls
+    calls = FakeLLaMA2.calls if engine == "llama2" else FakeLLM.calls
+    return hints, dict(calls[:1]).get("build"), calls[1:]
+
+
+def test_vllm_engine_matches_the_reference(tmp_path, monkeypatch):
+    hints, _, calls = run_engine("llama2", tmp_path, monkeypatch)
+    vllm_hints, engine_args, vllm_calls = run_engine("vllm", tmp_path, monkeypatch)
+    pd.testing.assert_frame_equal(hints, vllm_hints)
+    assert hints["hint_A"].str.contains(", because hint ").all()
+    assert engine_args["enable_prefix_caching"] is True
+
+    # the same prompts, tokenized, and the same sampling in the vLLM names
+    assert [p for prompts, _ in vllm_calls for p in prompts] == [
+        p for prompts, _ in calls for p in prompts
+    ]
+    assert len(vllm_calls) < len(calls)
+    _, params = calls[0]
+    _, sampling_params = vllm_calls[0]
+    assert params == generate_game_hints.GENERATION_PARAMS
+    assert sampling_params == {
+        "max_tokens": params["max_gen_len"],
+        "temperature": params["temperature"],
+        "top_p": params["top_p"],
+    }
+
+
+def test_engines_do_not_share_cached_responses(tmp_path, monkeypatch):
+    run_engine("llama2", tmp_path, monkeypatch, cache_mode="readwrite")
+    _, _, vllm_calls = run_engine("vllm", tmp_path, monkeypatch, cache_mode="readwrite")
+    assert sum(len(prompts) for prompts, _ in vllm_calls) == 4 * len(get_questions())
+    _, _, vllm_calls = run_engine("vllm", tmp_path, monkeypatch, cache_mode="readwrite")
+    assert not vllm_calls
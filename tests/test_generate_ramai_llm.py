@@ -0,0 +1,89 @@
+from functools import partial
+import pandas as pd
+import pytest
+
+pytest.importorskip("dotenv")
+import generate_ramai_llm
+from backends import MockBackend
+from model_registry import ModelRegistry
+from response_cache import ResponseCache
+from result_sink import ResultSink
+
+MODELS = ["Mixtral-8x7B", "GPT-4"]
+TEMPLATES = {
+    "Manipulative": {
+        1: "Convince me that {answer_LLM} is correct.",
+        2: "Explain why {answer_LLM} is the answer.",
+    }
+}
+
+
+class InterruptedBackend(MockBackend):
+    # number of prompts answered before the run is interrupted, shared by the
+    # instances
+    budget = None
+    prompts = []
+
+    def generate_batch(self, prompts: list, params: dict = None) -> list:
+        if self.budget is not None and len(self.prompts) >= self.budget:
+            raise KeyboardInterrupt
+        self.prompts.extend(prompts)
+        return super().generate_batch(prompts, params)
+
+
+def get_tasks(size: int = 4) -> list:
+    questions = pd.DataFrame(
+        {
+            "question_id": range(size),
+            "answer_LLM": ["ABCD"[i % 4] for i in range(size)],
+            "question": [f"question {i}" for i in range(size)],
+            **{
+                letter: [f"answer {letter}{i}" for i in range(size)]
+                for letter in "ABCD"
+            },
+        }
+    )
+    body = "{template}\nQuestion: {question}\nA: {A}\nB: {B}\nC: {C}\nD: {D}"
+    return generate_ramai_llm.get_tasks(
+        questions, TEMPLATES, body, "Manipulative", MODELS
+    )
+
+
+def run(tasks: list, path: str, budget: int = None) -> pd.DataFrame:
+    InterruptedBackend.budget = budget
+    InterruptedBackend.prompts = []
+    with ResultSink(path, generate_ramai_llm.TASK_KEY) as sink:
+        return generate_ramai_llm.generate_sequential(tasks, "Manipulative", sink)
+
+
+def test_interrupted_local_model_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        generate_ramai_llm,
+        "REGISTRY",
+        ModelRegistry(
+            {
+                model: partial(InterruptedBackend, generate_ramai_llm.MODEL_IDS[model])
+                for model in generate_ramai_llm.MODELS
+            },
+            exclusive=generate_ramai_llm.LOCAL_MODELS,
+        ),
+    )
+    monkeypatch.setattr(
+        generate_ramai_llm,
+        "CACHE",
+        ResponseCache(str(tmp_path / "responses.db"), "off"),
+    )
+    tasks = get_tasks()
+    expected = run(tasks, tmp_path / "full.jsonl")
+
+    # interrupted while the local model goes through its tasks one by one
+    path = tmp_path / "interrupted.jsonl"
+    with pytest.raises(KeyboardInterrupt):
+        run(tasks, path, budget=3)
+    with ResultSink(path, generate_ramai_llm.TASK_KEY) as sink:
+        assert len(sink) == 3
+        assert {record["model"] for record in sink.records.values()} == {MODELS[0]}
+
+    results = run(tasks, path)
+    assert len(InterruptedBackend.prompts) == len(tasks) - 3
+    pd.testing.assert_frame_equal(results, expected)
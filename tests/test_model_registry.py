@@ -0,0 +1,55 @@
+import time
+import threading
+from model_registry import ModelRegistry
+
+
+def slow_factory(name: str, seconds: float, loads: list):
+    def load():
+        loads.append(name)
+        time.sleep(seconds)
+        return name
+
+    return load
+
+
+def test_loaded_models_do_not_wait_for_a_load():
+    loads = []
+    registry = ModelRegistry(
+        {
+            "local": slow_factory("local", 1.0, loads),
+            "remote": slow_factory("remote", 0.0, loads),
+        },
+        exclusive=["local"],
+    )
+    registry.get("remote")
+    loader = threading.Thread(target=registry.get, args=["local"])
+    loader.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    with registry.use("remote") as model:
+        assert model == "remote"
+    assert time.monotonic() - start < 0.5
+    loader.join()
+    assert loads == ["remote", "local"]
+
+
+def test_concurrent_gets_load_once():
+    loads = []
+    registry = ModelRegistry(
+        {
+            "first": slow_factory("first", 0.3, loads),
+            "second": slow_factory("second", 0.3, loads),
+        },
+        exclusive=["first", "second"],
+    )
+    threads = [
+        threading.Thread(target=registry.get, args=[name])
+        for name in ["first", "first", "first"]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == ["first"]
+    registry.get("second")
+    assert list(registry.models) == ["second"]
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from extract_ramai_human_data import get_history_features
+from online_features import OnlineFeatureEngine, replay
+from schema import apply_schema, HINT_FEATURES
+
+
+def get_event(seed: int = 0, games: int = 12, questions: int = 10) -> tuple:
+    rng = np.random.default_rng(seed)
+    games_df = pd.DataFrame(
+        {
+            "id": rng.permutation(games) + 1,
+            "sex": rng.choice(["male", "female", None], games),
+            "age": rng.choice([0, 1, 2, 3, 4, np.nan], games),
+            "education": rng.choice([0, 1, 2, 3, 4], games).astype(float),
+        }
+    )
+    answers = pd.DataFrame(
+        {
+            "game_id": np.repeat(np.arange(1, games + 1), questions),
+            "question_count": np.tile(rng.permutation(questions), games),
+            "hint_used": rng.choice([0, 1, 1], games * questions),
+            "hint_correct": pd.array(
+                rng.choice([0, 1, -1], games * questions), dtype="Int8"
+            ),
+            "hint_trusted": rng.choice([0, 1], games * questions),
+            "hint_ans": rng.choice(list("ABCD"), games * questions),
+            "answer": rng.choice(list("ABCD"), games * questions),
+        }
+    ).sample(frac=1, random_state=seed)
+    # missing hint_correct values, as in the raw data
+    answers["hint_correct"] = answers["hint_correct"].mask(
+        answers["hint_correct"] == -1
+    )
+    return games_df, answers
+
+
+def test_replay_matches_batch_features():
+    games, answers = get_event()
+    assert answers["hint_correct"].isna().any()
+    expected = get_history_features(games, answers, "mlinpl")
+    actual = replay(OnlineFeatureEngine(), games, answers, "mlinpl")
+    for expected_df, actual_df in zip(expected, actual):
+        assert len(expected_df) > 0
+        pd.testing.assert_frame_equal(
+            apply_schema(actual_df, HINT_FEATURES),
+            apply_schema(expected_df.reset_index(drop=True), HINT_FEATURES),
+            check_dtype=False,
+        )
+
+
+def test_save_load_round_trip(tmp_path):
+    engine = OnlineFeatureEngine()
+    engine.start_game(np.int64(1), "mlinpl", "male", np.float64(2), np.float64(4))
+    engine.start_game(np.int64(2), "mlinpl", "female", 1.0, 0.0)
+    engine.update(np.int64(1), 1, pd.NA, 1, "A", "A")
+    engine.update(np.int64(2), 1, np.int8(0), 0, "B", "C")
+    path = tmp_path / "engine.json"
+    engine.save(path)
+    loaded = OnlineFeatureEngine.load(path)
+
+    assert loaded.players[1].last_hint_correct is pd.NA
+    assert loaded.players[2].last_hint_correct == 0
+    assert loaded.players[1].education == 3
+    assert loaded.stats.keys() == engine.stats.keys()
+    # the restored engine continues exactly like the original one
+    rows = [
+        [
+            state.update(game_id, 1, hint_correct, 1, "A", "B")
+            for game_id, hint_correct in [(1, 0), (2, pd.NA), (1, 1)]
+        ]
+        for state in [engine, loaded]
+    ]
+    assert rows[1][0]["last_hint_correct"] is pd.NA
+    assert rows[1] == rows[0]
+    assert vars(loaded.stats["hint_trusted"]["hint_density"]) == vars(
+        engine.stats["hint_trusted"]["hint_density"]
+    )
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+from question_index import QuestionIndex
+
+
+def get_believable_answers() -> pd.DataFrame:
+    # one row per believable answer, question 7 has two
+    return pd.DataFrame(
+        {
+            "question_id": [7, 3, 7],
+            "answer_LLM": ["B", "A", "D"],
+            "answer_correct": ["C", "A", "C"],
+        }
+    )
+
+
+def test_repeated_ids_are_an_error():
+    with pytest.raises(ValueError):
+        QuestionIndex(get_believable_answers(), key="question_id")
+
+
+def test_keep_first_matches_first_lookup():
+    believable = get_believable_answers()
+    questions = QuestionIndex(believable, key="question_id", keep="first")
+    hints = pd.DataFrame({"question_id": [3, 7, 7]})
+    joined = questions.join(hints, ["answer_LLM", "answer_correct"])
+    for _, row in joined.iterrows():
+        first = believable.loc[believable["question_id"] == row["question_id"]]
+        assert row["answer_LLM"] == first["answer_LLM"].values[0]
+        assert row["answer_correct"] == first["answer_correct"].values[0]
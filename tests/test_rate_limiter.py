@@ -0,0 +1,124 @@
+import random
+import pytest
+from rate_limiter import RateLimiter, TokenBucket, MIN_SCALE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, headers: dict):
+        self.headers = headers
+
+
+class RateLimitError(Exception):
+    def __init__(self, headers: dict = None):
+        super().__init__("rate limited")
+        self.status_code = 429
+        self.response = Response(headers or {})
+
+
+def get_limiter(rpm: float, **kwargs) -> tuple:
+    clock = FakeClock()
+    return RateLimiter(rpm, clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+def test_bucket_refill_and_wait():
+    bucket = TokenBucket(rate=2.0, capacity=4.0, now=0.0)
+    bucket.take(4)
+    assert bucket.wait(1) == pytest.approx(0.5)
+    bucket.refill(1.0)
+    assert bucket.level == pytest.approx(2.0)
+    assert bucket.wait(3) == pytest.approx(0.5)
+    # half the rate doubles the wait, and the bucket never overfills
+    assert bucket.wait(3, scale=0.5) == pytest.approx(1.0)
+    bucket.refill(10.0)
+    assert bucket.level == 4.0
+    # a request larger than the bucket waits for a full bucket and leaves debt
+    assert bucket.wait(10) == 0.0
+    bucket.take(10)
+    assert bucket.wait(1) == pytest.approx(3.5)
+
+
+def test_requests_are_spaced_by_the_rate():
+    limiter, clock = get_limiter(60, burst=2.0)
+    for _ in range(5):
+        limiter.acquire()
+    # the burst of 2 requests is free, the others wait a second each
+    assert clock.now == pytest.approx(3.0)
+
+
+def test_tokens_are_limited():
+    limiter, clock = get_limiter(6000, tpm=600, burst=1.0)
+    limiter.acquire(10)
+    limiter.acquire(10)
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_retry_after_is_honoured():
+    limiter, clock = get_limiter(6000)
+    attempts = []
+
+    def request():
+        attempts.append(clock.now)
+        if len(attempts) == 1:
+            raise RateLimitError({"retry-after": "2"})
+        if len(attempts) == 2:
+            raise RateLimitError({"retry-after-ms": "1500"})
+        return "done"
+
+    assert limiter.call(request) == "done"
+    assert attempts == [0.0, pytest.approx(2.0), pytest.approx(3.5)]
+
+
+def test_non_retryable_errors_are_raised():
+    limiter, _ = get_limiter(6000)
+
+    def request():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call(request)
+
+
+def test_throttling_scales_the_rate_down_and_back():
+    limiter, _ = get_limiter(60)
+    limiter.throttled(0.0)
+    assert limiter.scale == 0.5
+    for _ in range(10):
+        limiter.throttled(0.0)
+    assert limiter.scale == MIN_SCALE
+    for _ in range(17):
+        limiter.succeeded()
+    assert limiter.scale == pytest.approx(MIN_SCALE + 17 * 0.05)
+    for _ in range(10):
+        limiter.succeeded()
+    assert limiter.scale == 1.0
+
+
+def test_throttling_pauses_all_requests():
+    limiter, clock = get_limiter(6000)
+    limiter.throttled(5.0)
+    limiter.acquire()
+    assert clock.now == pytest.approx(5.0)
+
+
+def test_backoff_jitter_is_bounded():
+    limiter, _ = get_limiter(60, base_delay=0.5, max_delay=8.0)
+    random.seed(0)
+    for attempt in range(10):
+        bound = min(8.0, 0.5 * 2**attempt)
+        delays = [limiter.get_backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= bound for delay in delays)
+        # the jitter spreads the delays over the whole range
+        assert max(delays) > 0.9 * bound and min(delays) < 0.1 * bound
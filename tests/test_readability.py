@@ -0,0 +1,25 @@
+import pipeline
+from data_store import DataStore
+from readability import load_cache, save_cache, score_texts
+
+
+def test_concurrent_cache_updates_are_merged(tmp_path):
+    store = DataStore(str(tmp_path))
+    _, cache = score_texts(["A first text."], workers=1)
+    save_cache(store, cache)
+
+    # two runs read the same cache and score different texts
+    _, first = score_texts(["A second text."], load_cache(store), workers=1)
+    _, second = score_texts(["A third, longer text."], load_cache(store), workers=1)
+    save_cache(store, first)
+    save_cache(store, second)
+
+    cache = load_cache(store)
+    assert len(cache) == 3
+    assert set(first.index) | set(second.index) == set(cache.index)
+
+
+def test_stages_updating_the_cache_run_in_order():
+    dependencies = pipeline.get_dependencies(pipeline.STAGES)
+    assert "add_reading_difficulty" in dependencies["extract_linguistic_features"]
+    assert "extract_linguistic_features" not in dependencies["add_reading_difficulty"]